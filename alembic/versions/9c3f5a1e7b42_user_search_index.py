@@ -0,0 +1,68 @@
+"""full text search index over user name, username and email
+
+Revision ID: 9c3f5a1e7b42
+Revises: 4b1e9c7d2a60
+Create Date: 2026-10-18 11:04:52.618305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3f5a1e7b42'
+down_revision: Union[str, None] = '4b1e9c7d2a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FTS5 only exists on SQLite, other backends keep the ILIKE search
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    # External content table, the triggers keep it in sync with "user"
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE user_fts USING fts5(
+            name, username, email,
+            content='user', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_fts_insert AFTER INSERT ON user BEGIN
+            INSERT INTO user_fts(rowid, name, username, email) VALUES (new.id, new.name, new.username, new.email);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_fts_delete AFTER DELETE ON user BEGIN
+            INSERT INTO user_fts(user_fts, rowid, name, username, email)
+            VALUES ('delete', old.id, old.name, old.username, old.email);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_fts_update AFTER UPDATE OF name, username, email ON user BEGIN
+            INSERT INTO user_fts(user_fts, rowid, name, username, email)
+            VALUES ('delete', old.id, old.name, old.username, old.email);
+            INSERT INTO user_fts(rowid, name, username, email) VALUES (new.id, new.name, new.username, new.email);
+        END
+        """
+    )
+    op.execute("INSERT INTO user_fts(user_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP TRIGGER IF EXISTS user_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS user_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS user_fts_insert")
+    op.execute("DROP TABLE IF EXISTS user_fts")
@@ -1,7 +1,14 @@
-from .users import User
+from .users import User, UserRow
 from .sections import Section
+from .tasks import TaskRun
+from .outbox import OutboxEntry
+from . import search
 
 __all__ = [
     "User",
+    "UserRow",
     "Section",
+    "TaskRun",
+    "OutboxEntry",
+    "search",
 ]
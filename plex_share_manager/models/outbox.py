@@ -0,0 +1,34 @@
+# This file contains the OutboxEntry model, a Plex change committed with the database change that caused it
+
+# Local modules
+
+# stdlib
+from datetime import datetime
+
+# dependencies
+import reflex as rx
+from sqlmodel import Field
+import sqlalchemy
+
+
+class OutboxEntry(rx.Model, table=True):
+    __tablename__ = "plex_outbox"
+    # The worker takes the oldest pending entry of each email, so one user's changes reach Plex in order
+    __table_args__ = (sqlalchemy.Index("ix_plex_outbox_status_email", "status", "email"),)
+
+    # "update_access", "revoke_access", "invite" or "uninvite"
+    action: str
+    # Not a foreign key, the user is gone by the time a revoke or uninvite is sent
+    user_id: int
+    email: str
+    # "pending", "processing" while a leader sends it, "done", "dead" once it ran out of attempts or Plex rejected it,
+    # or "superseded" when a dead letter was not retried because a newer change for its email exists
+    status: str = Field(default="pending")
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime
+    last_error: str | None = Field(default=None)
+    created_at: datetime
+    processed_at: datetime | None = Field(default=None)
+    # Fencing token and time of the leader that claimed it, a leader only settles its own claims
+    fence: int | None = Field(default=None)
+    claimed_at: datetime | None = Field(default=None)
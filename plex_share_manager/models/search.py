@@ -0,0 +1,52 @@
+# This file contains the SQLite FTS5 index over user name, username and email.
+# The index is created by an Alembic migration and kept in sync by triggers, it is not a SQLModel model.
+
+# Local modules
+
+# stdlib
+import re
+
+# dependencies
+from alembic.autogenerate import comparators
+from alembic.operations import ops
+import sqlalchemy
+
+try:  # alembic >= 1.18 runs comparators by priority, older versions in registration order
+    from alembic.util import DispatchPriority
+
+    _after_tables = comparators.dispatch_for("schema", priority=DispatchPriority.LAST)
+except ImportError:
+    _after_tables = comparators.dispatch_for("schema")
+
+# Constants
+USER_FTS = "user_fts"
+RANKED_MATCHES = 1000  # bm25 scores every match, broader searches keep the id order
+_fts_enabled: dict[str, bool] = {}  # Database URL -> index exists
+
+user_fts = sqlalchemy.table(USER_FTS, sqlalchemy.column("rowid"), sqlalchemy.column("rank"))
+
+
+def fts_enabled(bind: sqlalchemy.Engine | sqlalchemy.Connection) -> bool:
+    """Check once per database whether the FTS5 index exists, other backends use ILIKE instead."""
+    key = str(bind.engine.url)
+    if key not in _fts_enabled:
+        _fts_enabled[key] = bind.dialect.name == "sqlite" and sqlalchemy.inspect(bind).has_table(USER_FTS)
+    return _fts_enabled[key]
+
+
+def match_query(search: str) -> str:
+    """Turn search input into an FTS5 query where every word must match as a prefix."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", search.lower()))
+
+
+def user_fts_match(query: str) -> sqlalchemy.ColumnElement[bool]:
+    """WHERE clause for an FTS5 query built by match_query, join user_fts on rowid to use it."""
+    return sqlalchemy.literal_column(USER_FTS).op("MATCH")(query)
+
+
+@_after_tables
+def _keep_user_fts(autogen_context, upgrade_ops: ops.UpgradeOps, schemas) -> None:
+    """Stop autogenerate from dropping the FTS5 table and its shadow tables."""
+    upgrade_ops.ops[:] = [
+        op for op in upgrade_ops.ops if not (isinstance(op, ops.DropTableOp) and op.table_name.startswith(USER_FTS))
+    ]
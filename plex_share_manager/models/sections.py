@@ -7,15 +7,19 @@
 # dependencies
 from sqlmodel import Relationship, Field
 import reflex as rx
+import sqlalchemy
 
 
 # association table
 class UserSectionLink(rx.Model, table=True):
+    # The primary key covers (user_id, section_id), this covers lookups by section
+    __table_args__ = (sqlalchemy.Index("ix_usersectionlink_section_id_user_id", "section_id", "user_id"),)
+
     user_id: int | None = Field(default=None, foreign_key="user.id", primary_key=True)
     section_id: int | None = Field(default=None, foreign_key="section.id", primary_key=True)
 
 
 class Section(rx.Model, table=True):
-    key: int
+    key: int = Field(unique=True, index=True)
     title: str
     users: list["User"] = Relationship(back_populates="sections", link_model=UserSectionLink)
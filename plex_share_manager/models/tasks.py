@@ -0,0 +1,28 @@
+# This file contains the TaskRun model, one row per run of a scheduled task
+
+# Local modules
+
+# stdlib
+from datetime import datetime
+
+# dependencies
+import reflex as rx
+from sqlmodel import Field
+import sqlalchemy
+
+
+class TaskRun(rx.Model, table=True):
+    __tablename__ = "task_run"
+    # The last runs of a task, newest first, for catch up and the settings page
+    __table_args__ = (sqlalchemy.Index("ix_task_run_task_started_at", "task", "started_at"),)
+
+    task: str
+    started_at: datetime
+    # Unset while the task runs, or if the process died during it
+    finished_at: datetime | None = Field(default=None)
+    duration_ms: int | None = Field(default=None)
+    rows_examined: int = Field(default=0)
+    rows_changed: int = Field(default=0)
+    error: str | None = Field(default=None)
+    # Fencing token of the leader lease the run started under
+    fence: int | None = Field(default=None)
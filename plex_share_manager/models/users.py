@@ -4,6 +4,7 @@
 from .sections import Section, UserSectionLink
 
 # stdlib
+from dataclasses import dataclass, fields
 from datetime import date
 
 # dependencies
@@ -14,9 +15,9 @@ import sqlalchemy
 
 class User(rx.Model, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    plex_id: int = Field(default=None)
-    name: str = Field(default=None)
-    username: str = Field(default=None)
+    plex_id: int = Field(default=None, index=True)
+    name: str = Field(default=None, index=True)
+    username: str = Field(default=None, index=True)
     email: str = Field(unique=True)
     avatar_url: str = Field(default=None)
     never_expire: bool = Field(default=False)
@@ -26,7 +27,38 @@ class User(rx.Model, table=True):
         sa_column=sqlalchemy.Column(
             "expiry_date",
             sqlalchemy.Date,
+            index=True,
         ),
     )
-    status: str = Field(default="expired")
+    status: str = Field(default="expired", index=True)
+    # Day the expired access was last applied in Plex, the daily task skips users already handled
+    access_applied_on: date | None = Field(default=None)
+    # Why Plex refused the invite, the outbox sets it when it gives up on one and clears it once one is sent
+    invite_error: str | None = Field(default=None)
     sections: list[Section] = Relationship(back_populates="users", link_model=UserSectionLink)
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    """Read-only dashboard row, only the columns the user table renders.
+
+    Never an event handler argument, Reflex rebuilds those with UserRow(**payload) which fails on a slotted dataclass.
+    Handlers take the row's id and load the user on the server.
+    """
+
+    id: int
+    plex_id: int | None
+    name: str | None
+    username: str | None
+    email: str
+    avatar_url: str | None
+    never_expire: bool
+    invite_pending: bool
+    expiry_date: date | None
+    status: str
+    invite_error: str | None
+
+    @classmethod
+    def columns(cls) -> list:
+        """User columns in field order, for select(*UserRow.columns())"""
+        return [getattr(User, field.name) for field in fields(cls)]
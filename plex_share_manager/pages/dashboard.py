@@ -1,8 +1,8 @@
 # Main dashboard page for the application.
 
 # Local modules
-from ..ui import base_page, components
-from ..models import User
+from ..ui import base_page, components, virtual_table
+from ..models import UserRow
 from ..state import UserState, ImportState
 
 # stdlib
@@ -10,6 +10,9 @@ from ..state import UserState, ImportState
 # dependencies
 import reflex as rx
 
+# Constants
+SEARCH_DEBOUNCE_MS = 300  # Search once typing pauses instead of on every keystroke
+
 
 def dashboard() -> rx.Component:
     """Create the main dashboard page."""
@@ -53,11 +56,14 @@ def dashboard() -> rx.Component:
                         ),
                         spacing="3",
                     ),
-                    rx.input(
-                        rx.input.slot(rx.icon("search", size=20)),
-                        on_change=UserState.set_filter_values,
-                        font_size="1.25rem",
-                        height="2.5rem",
+                    rx.debounce_input(
+                        rx.input(
+                            rx.input.slot(rx.icon("search", size=20)),
+                            on_change=UserState.set_filter_values,
+                            font_size="1.25rem",
+                            height="2.5rem",
+                        ),
+                        debounce_timeout=SEARCH_DEBOUNCE_MS,
                     ),
                     rx.hstack(
                         invite_user_dialog(),
@@ -69,33 +75,84 @@ def dashboard() -> rx.Component:
                     margin_bottom="1.75rem",
                     spacing="6",
                 ),
-                rx.table.root(
-                    rx.table.header(
-                        rx.table.row(
-                            column_header_cell("Avatar", "image"),
-                            column_header_cell("Name", "user-round"),
-                            column_header_cell("Email", "at-sign"),
-                            column_header_cell("Plex Username", "circle-user-round"),
-                            column_header_cell("Plex ID", "hash"),
-                            column_header_cell("Expiry Date", "calendar-days"),
-                            column_header_cell("Status", "circle-help"),
-                            column_header_cell("Actions", "cog"),
-                        ),
-                    ),
-                    rx.table.body(
-                        rx.foreach(UserState.all_users, create_table_row),
+                virtual_table(
+                    UserState.all_users,
+                    create_table_cells,
+                    rx.table.row(
+                        column_header_cell("Avatar", "image"),
+                        column_header_cell("Name", "user-round"),
+                        column_header_cell("Email", "at-sign"),
+                        column_header_cell("Plex Username", "circle-user-round"),
+                        column_header_cell("Plex ID", "hash"),
+                        column_header_cell("Expiry Date", "calendar-days"),
+                        column_header_cell("Status", "circle-help"),
+                        column_header_cell("Actions", "cog"),
                     ),
                     variant="surface",
                     background=rx.color("accent", 3),
                     size="3",
-                    align="center",
+                    width="100%",
+                    row_hover={"background": rx.color("accent", 4)},
                 ),
+                pagination_controls(),
                 align="center",
             ),
+            # One instance of each user dialog, opened for the selected row through UserState.user_dialog
+            update_user_dialog(),
+            update_user_sections_dialog(),
+            delete_users_dialog(),
+            uninvite_user_dialog(),
         )
     )
 
 
+def pagination_controls() -> rx.Component:
+    """Create the page navigation and page size controls below the table."""
+    return rx.hstack(
+        rx.text(UserState.total_users, " users", color_scheme="gray"),
+        rx.hstack(
+            rx.icon_button(
+                rx.icon("chevrons-left", size=20),
+                on_click=UserState.set_page_number(1),
+                disabled=UserState.page <= 1,
+                variant="soft",
+            ),
+            rx.icon_button(
+                rx.icon("chevron-left", size=20),
+                on_click=UserState.previous_page,
+                disabled=UserState.page <= 1,
+                variant="soft",
+            ),
+            rx.text("Page ", UserState.page, " of ", UserState.page_count),
+            rx.icon_button(
+                rx.icon("chevron-right", size=20),
+                on_click=UserState.next_page,
+                disabled=UserState.page >= UserState.page_count,
+                variant="soft",
+            ),
+            rx.icon_button(
+                rx.icon("chevrons-right", size=20),
+                on_click=UserState.set_page_number(UserState.page_count),
+                disabled=UserState.page >= UserState.page_count,
+                variant="soft",
+            ),
+            align="center",
+            spacing="2",
+        ),
+        rx.select(
+            UserState.page_size_options,
+            value=UserState.page_size.to(str),
+            on_change=UserState.set_page_size_value,
+            size="2",
+        ),
+        align="center",
+        justify="between",
+        width="100%",
+        margin_top="1rem",
+        margin_bottom="1.75rem",
+    )
+
+
 def column_header_cell(text: str, icon: str) -> rx.Component:
     """Create a table head cell with an text and icon."""
     return rx.table.column_header_cell(
@@ -108,9 +165,9 @@ def column_header_cell(text: str, icon: str) -> rx.Component:
     )
 
 
-def create_table_row(user: User) -> rx.Component:
-    """Create a row for a user in the table."""
-    return rx.table.row(
+def create_table_cells(user: UserRow) -> rx.Component:
+    """Create the cells of a user's row, the virtual table renders them for the rows in view."""
+    return rx.fragment(
         rx.table.cell(
             rx.avatar(src=user.avatar_url, fallback=user.email[0]),
             align="center",
@@ -121,13 +178,17 @@ def create_table_row(user: User) -> rx.Component:
         rx.table.cell(user.plex_id),
         rx.table.cell(user.expiry_date.to(str)),
         rx.table.cell(
-            rx.match(
-                user.status.lower(),
-                ("active", components.status_badge("active")),
-                ("expiring", components.status_badge("expiring")),
-                ("expired", components.status_badge("expired")),
-                ("never", components.status_badge("never")),
-                components.status_badge("default"),
+            rx.cond(
+                user.invite_error,
+                rx.tooltip(components.status_badge("invite failed"), content=user.invite_error),
+                rx.match(
+                    user.status.lower(),
+                    ("active", components.status_badge("active")),
+                    ("expiring", components.status_badge("expiring")),
+                    ("expired", components.status_badge("expired")),
+                    ("never", components.status_badge("never")),
+                    components.status_badge("default"),
+                ),
             ),
             align="center",
         ),
@@ -135,11 +196,25 @@ def create_table_row(user: User) -> rx.Component:
             rx.hstack(
                 rx.cond(
                     user.invite_pending,
-                    uninvite_user_dialog(user),
+                    row_action_button(
+                        UserState.open_user_dialog("uninvite", user.id),
+                        text="Uninvite",
+                        icon="user-round-minus",
+                        color_scheme="crimson",
+                    ),
                     rx.fragment(
-                        update_user_dialog(user),
-                        update_user_sections_dialog(user),
-                        delete_users_dialog(user),
+                        row_action_button(UserState.open_user_dialog("edit", user.id), text="Edit", icon="square-pen"),
+                        row_action_button(
+                            UserState.open_user_dialog("sections", user.id),
+                            text="Share",
+                            icon="share-2",
+                            color_scheme="yellow",
+                        ),
+                        row_action_button(
+                            UserState.open_user_dialog("delete", user.id),
+                            icon="trash-2",
+                            color_scheme="crimson",
+                        ),
                     ),
                 ),
                 align="center",
@@ -147,7 +222,6 @@ def create_table_row(user: User) -> rx.Component:
             ),
             align="center",
         ),
-        _hover={"background": rx.color("accent", 4)},
     )
 
 
@@ -288,15 +362,8 @@ def invite_user_dialog() -> rx.Component:
     )
 
 
-def uninvite_user_dialog(user: User) -> rx.Component:
+def uninvite_user_dialog() -> rx.Component:
     return rx.dialog.root(
-        create_dialog_trigger(
-            text="Uninvite",
-            icon="user-round-minus",
-            color_scheme="crimson",
-            button_size="2",
-            text_size="3",
-        ),
         rx.dialog.content(
             rx.hstack(
                 rx.badge(
@@ -328,13 +395,13 @@ def uninvite_user_dialog(user: User) -> rx.Component:
             rx.heading("User to Uninvite", padding_top="1rem", color_scheme="crimson"),
             rx.hstack(
                 rx.text(
-                    user.name,
+                    UserState.current_user.name,
                     padding_bottom="2rem",
                     size="3",
                     font_weight="bold",
                 ),
                 rx.text(
-                    user.email,
+                    UserState.current_user.email,
                     padding_bottom="2rem",
                     size="3",
                     font_weight="bold",
@@ -359,7 +426,7 @@ def uninvite_user_dialog(user: User) -> rx.Component:
                         variant="surface",
                         color_scheme="crimson",
                         size="4",
-                        on_click=UserState.uninvite_user(user),
+                        on_click=UserState.uninvite_user,
                     ),
                 ),
                 spacing="4",
@@ -372,13 +439,14 @@ def uninvite_user_dialog(user: User) -> rx.Component:
             border_color=rx.color("accent", 7),
             border_radius="25px",
         ),
+        open=UserState.user_dialog == "uninvite",
+        on_open_change=UserState.close_user_dialog,
     )
 
 
-def update_user_dialog(user: User) -> rx.Component:
+def update_user_dialog() -> rx.Component:
     """Create a dialog for updating a user."""
     return rx.dialog.root(
-        create_dialog_trigger(text="Edit", icon="square-pen", icon_size=22, button_size="2", text_size="3"),
         rx.dialog.content(
             rx.hstack(
                 rx.badge(
@@ -409,9 +477,9 @@ def update_user_dialog(user: User) -> rx.Component:
                 rx.form.root(
                     rx.flex(
                         # Username
-                        components.not_editable_field(user.username, "user-round", "Plex Username"),
+                        components.not_editable_field(UserState.current_user.username, "user-round", "Plex Username"),
                         # Email
-                        components.not_editable_field(user.email, "mail", "Email"),
+                        components.not_editable_field(UserState.current_user.email, "mail", "Email"),
                         # Full Name
                         components.form_input_field(
                             label="Full Name",
@@ -419,7 +487,7 @@ def update_user_dialog(user: User) -> rx.Component:
                             type="text",
                             name="name",
                             icon="user-round",
-                            default_value=user.name,
+                            default_value=UserState.current_user.name,
                         ),
                         rx.hstack(
                             # Expiry Date
@@ -429,14 +497,14 @@ def update_user_dialog(user: User) -> rx.Component:
                                 type="date",
                                 name="expiry_date",
                                 icon="calendar-days",
-                                default_value=user.expiry_date.to(str),
+                                default_value=UserState.current_user.expiry_date.to(str),
                             ),
                             # Status
                             components.form_switch_box(
                                 text="Never Expire",
                                 name="never_expire",
                                 form_value=True,
-                                selected=user.never_expire,
+                                selected=UserState.current_user.never_expire,
                                 icon="star",
                                 display_icon=True,
                             ),
@@ -484,22 +552,14 @@ def update_user_dialog(user: User) -> rx.Component:
             border="2px solid",
             border_color=rx.color("accent", 7),
             border_radius="25px",
-            on_open_auto_focus=UserState.set_current_user(user),
-            on_close_auto_focus=UserState.set_all_users,
         ),
+        open=UserState.user_dialog == "edit",
+        on_open_change=UserState.close_user_dialog,
     )
 
 
-def update_user_sections_dialog(user: User) -> rx.Component:
+def update_user_sections_dialog() -> rx.Component:
     return rx.dialog.root(
-        create_dialog_trigger(
-            text="Share",
-            icon="share-2",
-            icon_size=22,
-            color_scheme="yellow",
-            button_size="2",
-            text_size="3",
-        ),
         rx.dialog.content(
             rx.hstack(
                 rx.badge(
@@ -598,18 +658,14 @@ def update_user_sections_dialog(user: User) -> rx.Component:
             border="2px solid",
             border_color=rx.color("accent", 7),
             border_radius="25px",
-            on_open_auto_focus=[
-                UserState.set_all_sections,
-                UserState.set_current_user(user),
-                UserState.unset_current_user_sections,
-            ],
         ),
+        open=UserState.user_dialog == "sections",
+        on_open_change=UserState.close_user_dialog,
     )
 
 
-def delete_users_dialog(user: User) -> rx.Component:
+def delete_users_dialog() -> rx.Component:
     return rx.dialog.root(
-        create_dialog_trigger(icon="trash-2", icon_size=22, color_scheme="crimson", button_size="2", text_size="3"),
         rx.dialog.content(
             rx.hstack(
                 rx.badge(
@@ -641,13 +697,13 @@ def delete_users_dialog(user: User) -> rx.Component:
             rx.heading("User to Delete", padding_top="1rem", color_scheme="crimson"),
             rx.hstack(
                 rx.text(
-                    user.name,
+                    UserState.current_user.name,
                     padding_bottom="2rem",
                     size="3",
                     font_weight="bold",
                 ),
                 rx.text(
-                    user.email,
+                    UserState.current_user.email,
                     padding_bottom="2rem",
                     size="3",
                     font_weight="bold",
@@ -672,7 +728,7 @@ def delete_users_dialog(user: User) -> rx.Component:
                         variant="surface",
                         color_scheme="crimson",
                         size="4",
-                        on_click=UserState.delete_user(user),
+                        on_click=UserState.delete_user,
                     ),
                 ),
                 spacing="4",
@@ -685,6 +741,34 @@ def delete_users_dialog(user: User) -> rx.Component:
             border_color=rx.color("accent", 7),
             border_radius="25px",
         ),
+        open=UserState.user_dialog == "delete",
+        on_open_change=UserState.close_user_dialog,
+    )
+
+
+def row_action_button(
+    on_click: rx.event.EventSpec,
+    text: str = "",
+    icon: str = "shield-alert",
+    color_scheme: str = "iris",
+) -> rx.Component:
+    """Plain table row button that opens one of the page level user dialogs."""
+    return rx.button(
+        rx.icon(icon, size=22),
+        rx.cond(
+            text != "",
+            rx.text(
+                text,
+                size="3",
+                display=["none", "none", "block"],
+            ),
+            rx.fragment(),
+        ),
+        color_scheme=color_scheme,
+        size="2",
+        variant="surface",
+        padding="1rem",
+        on_click=on_click,
     )
 
 
@@ -767,6 +851,12 @@ def plex_user_sync_dialog() -> rx.Component:
                 width="100%",
             ),
             rx.divider(),
+            rx.hstack(
+                rx.cond(ImportState.running, rx.spinner(size="2"), rx.icon("check", size=18)),
+                rx.text(ImportState.progress, " Plex users checked", size="2"),
+                padding_top="1rem",
+                align="center",
+            ),
             rx.heading("Users to Add", padding_top="1rem", color=rx.color("accent", 10)),
             rx.inset(
                 rx.skeleton(
@@ -842,6 +932,7 @@ def plex_user_sync_dialog() -> rx.Component:
                         variant="surface",
                         color_scheme="gray",
                         size="4",
+                        on_click=ImportState.cancel_import,
                     ),
                 ),
                 rx.form.submit(
@@ -868,7 +959,10 @@ def plex_user_sync_dialog() -> rx.Component:
                 ImportState.clear_state,
                 ImportState.import_plex_users,
             ],
-            on_close_auto_focus=UserState.set_all_users,
+            on_close_auto_focus=[
+                ImportState.cancel_import,
+                UserState.set_all_users,
+            ],
         ),
     )
 
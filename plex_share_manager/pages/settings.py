@@ -2,7 +2,9 @@
 
 # Local modules
 from ..ui import base_page
-from ..models import Section
+from ..models import OutboxEntry, Section, TaskRun
+from ..tasks import outbox
+from ..tasks.runs import last_runs
 from rxconfig import logger, config_state, config_file
 
 # stdlib
@@ -27,6 +29,11 @@ class SettingState(rx.State):
     enable_disable_expired_users_task: bool
     allow_sync: bool
     log_level: str
+    update_status_schedule: str
+    disable_expired_users_schedule: str
+    task_runs: list[TaskRun] = []
+    outbox_pending: int = 0
+    outbox_dead: list[OutboxEntry] = []
 
     @rx.event
     def page_load(self) -> None:
@@ -51,6 +58,27 @@ class SettingState(rx.State):
         self.allow_sync = self._config["ALLOW_SYNC"]
         self.plextoken = self._config["PLEXAPI_AUTH_SERVER_TOKEN"]
         self.plexbaseurl = self._config["PLEXAPI_AUTH_SERVER_BASEURL"]
+        # Schedules are edited in config.toml, older files fall back to the defaults
+        self.update_status_schedule = config_state.app_settings["UPDATE_STATUS_SCHEDULE"]
+        self.disable_expired_users_schedule = config_state.app_settings["DISABLE_EXPIRED_USERS_SCHEDULE"]
+        self.task_runs = last_runs()
+        self.outbox_pending, self.outbox_dead = outbox.outbox_summary()
+
+    @rx.event
+    def refresh_task_runs(self) -> None:
+        """Reload the last task runs and the Plex outbox."""
+        self.task_runs = last_runs()
+        self.outbox_pending, self.outbox_dead = outbox.outbox_summary()
+
+    @rx.event
+    def retry_dead_letters(self) -> rx.Component:
+        """Queue the dead lettered Plex changes again."""
+        retried, superseded = outbox.retry_dead_letters()
+        outbox.outbox_worker.notify()
+        self.outbox_pending, self.outbox_dead = outbox.outbox_summary()
+        return rx.toast.success(
+            f"Queued {retried} Plex changes again, dropped {superseded} superseded by a newer change"
+        )
 
     @rx.event
     def change_plextoken(self, value) -> None:
@@ -315,6 +343,49 @@ def settings() -> rx.Component:
                     width="50%",
                 ),
                 rx.divider(margin_y="2rem", width="60%"),
+                rx.hstack(
+                    rx.vstack(
+                        rx.heading("Task Runs", _as="h1"),
+                        rx.text("The last runs of the scheduled tasks."),
+                        rx.text(
+                            "Schedules are cron expressions set in config.toml: update status ",
+                            rx.code(SettingState.update_status_schedule),
+                            ", disable expired users ",
+                            rx.code(SettingState.disable_expired_users_schedule),
+                            ".",
+                        ),
+                        rx.button(
+                            rx.icon("refresh-cw", size=16),
+                            "Refresh",
+                            on_click=SettingState.refresh_task_runs,
+                            variant="soft",
+                        ),
+                        max_width="30%",
+                    ),
+                    rx.spacer(),
+                    render_task_runs(SettingState.task_runs),
+                    width="50%",
+                ),
+                rx.divider(margin_y="2rem", width="60%"),
+                rx.hstack(
+                    rx.vstack(
+                        rx.heading("Plex Outbox", _as="h1"),
+                        rx.text("User changes waiting to be sent to Plex, and the ones that failed every retry."),
+                        rx.text(rx.text.strong(SettingState.outbox_pending, " pending")),
+                        rx.button(
+                            rx.icon("rotate-ccw", size=16),
+                            "Retry failed",
+                            on_click=SettingState.retry_dead_letters,
+                            disabled=~SettingState.outbox_dead,
+                            variant="soft",
+                        ),
+                        max_width="30%",
+                    ),
+                    rx.spacer(),
+                    render_dead_letters(SettingState.outbox_dead),
+                    width="50%",
+                ),
+                rx.divider(margin_y="2rem", width="60%"),
                 align="center",
             ),
         ),
@@ -370,3 +441,61 @@ def render_switch(value, handler) -> rx.Component:
         variant="soft",
         on_change=handler,
     )
+
+
+def render_task_runs(runs) -> rx.Component:
+    return rx.table.root(
+        rx.table.header(
+            rx.table.row(
+                rx.table.column_header_cell("Task"),
+                rx.table.column_header_cell("Started"),
+                rx.table.column_header_cell("Duration"),
+                rx.table.column_header_cell("Examined"),
+                rx.table.column_header_cell("Changed"),
+                rx.table.column_header_cell("Error"),
+            ),
+        ),
+        rx.table.body(
+            rx.foreach(
+                runs,
+                lambda run: rx.table.row(
+                    rx.table.cell(run.task),
+                    rx.table.cell(run.started_at),
+                    rx.table.cell(rx.cond(run.finished_at, f"{run.duration_ms} ms", "running")),
+                    rx.table.cell(run.rows_examined),
+                    rx.table.cell(run.rows_changed),
+                    rx.table.cell(rx.text(run.error, color_scheme="red")),
+                ),
+            ),
+        ),
+        size="1",
+        variant="surface",
+    )
+
+
+def render_dead_letters(entries) -> rx.Component:
+    return rx.table.root(
+        rx.table.header(
+            rx.table.row(
+                rx.table.column_header_cell("Action"),
+                rx.table.column_header_cell("Email"),
+                rx.table.column_header_cell("Queued"),
+                rx.table.column_header_cell("Attempts"),
+                rx.table.column_header_cell("Error"),
+            ),
+        ),
+        rx.table.body(
+            rx.foreach(
+                entries,
+                lambda entry: rx.table.row(
+                    rx.table.cell(entry.action),
+                    rx.table.cell(entry.email),
+                    rx.table.cell(entry.created_at),
+                    rx.table.cell(entry.attempts),
+                    rx.table.cell(rx.text(entry.last_error, color_scheme="red")),
+                ),
+            ),
+        ),
+        size="1",
+        variant="surface",
+    )
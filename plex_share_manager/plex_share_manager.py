@@ -5,8 +5,8 @@ from .state import UserState
 from .ui import base_theme
 from .pages import dashboard, settings, SettingState
 from .navigation import routes
-from .tasks import daily_tasks
-from rxconfig import config_state
+from .tasks import leader_tasks
+from .utils import avatars, plex_async
 
 
 # stdlib
@@ -38,5 +38,10 @@ app.add_page(
     route=routes.DASHBOARD_ROUTE,
 )
 
-if config_state.app_settings["ENABLE_ALL_TASKS"] is True:
-    app.register_lifespan_task(daily_tasks)
+# Avatars are cached locally and served with long lived cache headers
+app.api.add_api_route(f"{avatars.AVATAR_ROUTE}/{{key}}", avatars.serve_avatar, methods=["GET"])
+
+# Every worker competes for the leader lease, only the leader sends the Plex outbox and runs the scheduled tasks
+app.register_lifespan_task(leader_tasks)
+# Closes the pooled Plex HTTP client on shutdown
+app.register_lifespan_task(plex_async.client_lifespan)
@@ -1,16 +1,26 @@
 # This page is used to import users from Plex into the database.
 
 # Local modules
-from ..utils import plex_connector
+from ..utils import avatars, offload, plex_async, utils
 from ..models import User
 from ..models import Section
+from ..models.sections import UserSectionLink
 
 # stdlib
-
+import contextlib
+from typing import AsyncIterator, Callable
 
 # dependencies
 import reflex as rx
-from sqlmodel import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+# Constants
+# Fields taken from Plex on import, local fields like name and expiry_date are never overwritten
+IMPORTED_FIELDS = ("username", "plex_id", "avatar_url", "invite_pending")
+# SQLite before 3.32 binds at most 999 parameters per statement, later versions 32766
+MAX_BOUND_PARAMETERS = 999
+QUERY_CHUNK_SIZE = 500  # Values per IN list, one parameter each
 
 
 class ImportState(rx.State):
@@ -21,11 +31,15 @@ class ImportState(rx.State):
     is_loaded: bool = False
     # Import background state
     running: bool = False
+    progress: int = 0
+    # Bumped by every import start and cancel, a background import only adds pages while it is still the latest
+    _import_seq: int = 0
 
     @rx.event
     def clear_state(self):
         """Clear all state variables"""
         self.set_is_loaded(False)
+        self.set_progress(0)
         self.set_new_users([])
         self.set_updated_users([])
         self.set_update_sections([])
@@ -38,53 +52,57 @@ class ImportState(rx.State):
             return len(sections) > 0
 
     @rx.event(background=True)
-    async def import_plex_users(self) -> list[User]:
-        """Fetch users from Plex server."""
-        updated_users: list[User] = []
-        new_users: list[User] = []
+    async def import_plex_users(self) -> rx.Component | None:
+        """Fetch users from Plex server, showing new and changed users page by page."""
         async with self:
+            self._import_seq += 1
+            import_seq = self._import_seq
             self.running = True
-        plex_users = plex_connector.get_plex_users()
-        if plex_users:
-            for user in plex_users:
-                if check_user_exists(user.email) is False:
-                    new_users.append(user)
-                elif user_to_update(user):
-                    updated_users.append(user)
-        async with self:
-            self.new_users = new_users
-            self.updated_users = updated_users
-            self.running = False
-            self.set_is_loaded(True)
+            self.progress = 0
+        try:
+            async with contextlib.aclosing(plex_async.iter_plex_users()) as pages:
+                async for page in pages:
+                    new_users, updated_users = await offload.run_sync(diff_users, page)
+                    async with self:
+                        if import_seq != self._import_seq:
+                            break
+                        self.new_users.extend(new_users)
+                        self.updated_users.extend(updated_users)
+                        self.progress += len(page)
+                        self.set_is_loaded(True)
+        except Exception as e:
+            return rx.toast.error(f"Failed to fetch Plex users: {e}")
+        finally:
+            async with self:
+                # A cancelled run leaves the state to the import that replaced it
+                if import_seq == self._import_seq:
+                    self.running = False
+                    self.set_is_loaded(True)
+
+    @rx.event
+    def cancel_import(self) -> None:
+        """Stop a running user import after the page in flight"""
+        self._import_seq += 1
+        self.running = False
 
     @rx.event(background=True)
-    async def do_user_sync(self) -> rx.Component:
-        total_users = len(self.new_users) + len(self.updated_users)
-        with rx.session() as session:
-            if self.new_users != []:
-                for user in self.new_users:
-                    session.add(user)
-            if self.updated_users != []:
-                for user in self.updated_users:
-                    updated_user = update_user_data(user)
-                    session.add(updated_user)
-            async with self:
-                session.commit()
-                self.new_users = []
-                self.updated_users = []
-        return rx.toast.success(f"Imported and Updated {total_users} Successfully")
+    async def do_user_sync(self) -> AsyncIterator[rx.Component]:
+        users = self.new_users + self.updated_users
+        inserted, updated = await offload.run_sync(save_users, users)
+        async with self:
+            self.new_users = []
+            self.updated_users = []
+        yield rx.toast.success(f"Imported {inserted} and Updated {updated} users Successfully")
+        # Fetch the imported avatars now, so the dashboard does not wait on plex.tv for them
+        await avatars.warm([user.avatar_url for user in users])
 
     @rx.event(background=True)
     async def import_plex_sections(self):
         """Fetch sections from Plex server."""
-        new_sections: list[Section] = []
         async with self:
             self.running = True
-        plex_sections = plex_connector.get_plex_sections()
-        if plex_sections:
-            for section in plex_sections:
-                if section_exists(section) is False:
-                    new_sections.append(section)
+        plex_sections = await plex_async.get_plex_sections()
+        new_sections = await offload.run_sync(missing_sections, plex_sections or [])
         async with self:
             self.update_sections = new_sections
             self.running = False
@@ -92,14 +110,10 @@ class ImportState(rx.State):
 
     @rx.event(background=True)
     async def do_section_sync(self) -> rx.Component:
-        total_sections = len(self.update_sections)
-        with rx.session() as session:
-            for section in self.update_sections:
-                session.add(section)
-                session.commit()
+        inserted, updated = await offload.run_sync(save_sections, self.update_sections)
         async with self:
             self.update_sections = []
-        return rx.toast.success(f"Imported and Updated {total_sections} Successfully")
+        return rx.toast.success(f"Imported {inserted} and Updated {updated} sections Successfully")
 
 
 ######################
@@ -121,28 +135,106 @@ def section_exists(section: Section) -> bool:
         return existing_section is not None
 
 
-def user_to_update(user: User) -> bool:
-    user_should_update: User = User()
+def missing_sections(sections: list[Section]) -> list[Section]:
+    """Sections not in the database yet."""
+    return [section for section in sections if section_exists(section) is False]
+
+
+def diff_users(plex_users: list[User]) -> tuple[list[User], list[User]]:
+    """Split Plex users into new and changed ones, loading existing rows in chunked IN queries."""
+    existing_users: dict[str, User] = {}
+    emails = [user.email for user in plex_users]
     with rx.session() as session:
-        user_should_update = session.exec(select(User).where(User.email == user.email)).one_or_none()
-        if user_should_update is None:
-            return False
-        elif (
-            user_should_update.username is None
-            or user_should_update.email is None
-            or user_should_update.plex_id is None
-            or user_should_update.avatar_url is None
-        ):
-            return True
-    return False
+        for chunk in utils.chunked(emails, QUERY_CHUNK_SIZE):
+            for existing_user in session.exec(select(User).where(User.email.in_(chunk))).all():
+                existing_users[existing_user.email] = existing_user
+    new_users: list[User] = []
+    updated_users: list[User] = []
+    for user in plex_users:
+        existing_user = existing_users.get(user.email)
+        if existing_user is None:
+            new_users.append(user)
+        elif any(getattr(existing_user, field) != getattr(user, field) for field in IMPORTED_FIELDS):
+            updated_users.append(user)
+    return new_users, updated_users
+
+
+def save_users(users: list[User]) -> tuple[int, int]:
+    """Upsert users in one transaction, returns (inserted, updated)."""
+    with rx.session() as session:
+        inserted, updated = upsert_users(session, users)
+        session.commit()
+    return inserted, updated
 
 
-def update_user_data(user: User) -> User:
+def save_sections(sections: list[Section]) -> tuple[int, int]:
+    """Upsert sections in one transaction, returns (inserted, updated)."""
     with rx.session() as session:
-        existing_user = session.exec(select(User).where(User.email == user.email)).one()
-    setattr(existing_user, "username", user.username)
-    setattr(existing_user, "email", user.email)
-    setattr(existing_user, "plex_id", user.plex_id)
-    setattr(existing_user, "avatar_url", user.avatar_url)
-    setattr(existing_user, "invite_pending", user.invite_pending)
-    return existing_user
+        inserted, updated = upsert_sections(session, sections)
+        session.commit()
+    return inserted, updated
+
+
+def upsert_users(session: Session, users: list[User]) -> tuple[int, int]:
+    """Insert or update users by email in chunked INSERT ... ON CONFLICT statements, returns (inserted, updated).
+
+    Existing rows only take the IMPORTED_FIELDS, new rows also get their shared sections linked.
+    """
+    insert = _dialect_insert(session)
+    section_ids = {key: id for id, key in session.exec(select(Section.id, Section.key)).all()}
+    inserted = 0
+    for chunk in utils.chunked(users, _rows_per_statement(len(User.__table__.columns) - 1)):
+        emails = [user.email for user in chunk]
+        existing = set(session.exec(select(User.email).where(User.email.in_(emails))).all())
+        rows = [user.model_dump(exclude={"id"}) for user in chunk]
+        statement = insert(User).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[User.email],
+            set_={field: getattr(statement.excluded, field) for field in IMPORTED_FIELDS},
+        )
+        session.execute(statement)
+        new_users = [user for user in chunk if user.email not in existing]
+        inserted += len(new_users)
+        if new_users:
+            user_ids = dict(
+                session.exec(
+                    select(User.email, User.id).where(User.email.in_([user.email for user in new_users]))
+                ).all()
+            )
+            links = [
+                {"user_id": user_ids[user.email], "section_id": section_ids[section.key]}
+                for user in new_users
+                for section in user.sections
+                if section.key in section_ids
+            ]
+            for links_chunk in utils.chunked(links, _rows_per_statement(2)):
+                session.execute(insert(UserSectionLink).values(links_chunk).on_conflict_do_nothing())
+    return inserted, len(users) - inserted
+
+
+def upsert_sections(session: Session, sections: list[Section]) -> tuple[int, int]:
+    """Insert or retitle sections by key in chunked INSERT ... ON CONFLICT statements, returns (inserted, updated)."""
+    insert = _dialect_insert(session)
+    inserted = 0
+    for chunk in utils.chunked(sections, _rows_per_statement(2)):
+        keys = [section.key for section in chunk]
+        existing = set(session.exec(select(Section.key).where(Section.key.in_(keys))).all())
+        statement = insert(Section).values([{"key": section.key, "title": section.title} for section in chunk])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Section.key], set_={"title": statement.excluded.title}
+        )
+        session.execute(statement)
+        inserted += len(set(keys) - existing)
+    return inserted, len(sections) - inserted
+
+
+def _rows_per_statement(columns: int) -> int:
+    """Rows a multi-row INSERT of this many columns can hold within MAX_BOUND_PARAMETERS."""
+    return max(1, MAX_BOUND_PARAMETERS // columns)
+
+
+def _dialect_insert(session: Session) -> Callable:
+    """Pick the INSERT construct with ON CONFLICT support for the configured database."""
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
@@ -1,25 +1,35 @@
 # Main dashboard page for the application.
 
 # Local modules
-from ..models import User, Section
-from ..utils import utils, plex_connector
+from ..models import User, UserRow, Section, search
+from ..utils import avatars, offload, utils
+from ..tasks import expiry_scheduler, outbox
 from .importstate import check_user_exists
 
 # stdlib
+import dataclasses
+import math
 
 # dependencies
 import reflex as rx
+from sqlalchemy import ColumnElement
 from sqlalchemy.orm import selectinload
-from sqlmodel import select, asc, desc, or_
+from sqlmodel import select, asc, desc, func, or_
+
+# Constants
+AVATAR_COLUMN = [field.name for field in dataclasses.fields(UserRow)].index("avatar_url")
+PAGE_SIZES = ["25", "50", "100", "200", "500", "1000"]  # Larger pages are cheap, the table only mounts the rows in view
 
 
 class UserState(rx.State):
     # User State vars
-    all_users: rx.Field[list[User]] = rx.field(list[User]())
+    all_users: rx.Field[list[UserRow]] = rx.field(list[UserRow]())
     current_user: rx.Field[User] = rx.field(User())
     all_sections: rx.Field[list[Section]] = rx.field(list[Section]())
     current_user_sections: rx.Field[dict[int, bool]] = rx.field(dict())
     form_data: rx.Field[dict] = rx.field(dict())
+    # Which page level user dialog is open: "edit", "sections", "delete", "uninvite" or ""
+    user_dialog: str = ""
     # Sort and Filter vars
     _FIELD_MAPPING = {
         "ID": "plex_id",
@@ -32,61 +42,170 @@ class UserState(rx.State):
     sort_reverse: bool = False
     sort_value: str = ""
     filter_value: str = ""
+    # Pagination vars
+    page_size_options: list[str] = PAGE_SIZES
+    page_size: int = int(PAGE_SIZES[1])
+    page: int = 1
+    total_users: int = 0
+    # Bumped by every load, a background search only publishes if it is still the latest
+    _search_seq: int = 0
+
+    @rx.var(cache=True)
+    def page_count(self) -> int:
+        """Number of pages for the current filter, at least one"""
+        return max(1, math.ceil(self.total_users / self.page_size))
 
     @rx.event
     def set_all_users(self) -> None:
-        """Set State.var "users" from User DB Model, Filter(search) and Sort"""
-        with rx.session() as session:
-            query = select(User)
-            # Filter based on search input value
-            if self.filter_value != "":
-                filter_value = f"%{self.filter_value.lower()}%"
-                query = query.where(
-                    or_(
-                        User.id.ilike(filter_value),
-                        User.name.ilike(filter_value),
-                        User.username.ilike(filter_value),
-                        User.email.ilike(filter_value),
-                        User.expiry_date.ilike(filter_value),
-                    )
-                )
-            # Sort based on the selected column
-            if self.sort_value != "":
-                sort_column = getattr(User, self.sort_value)
-                order = desc(sort_column) if self.sort_reverse else asc(sort_column)
-                query = query.order_by(order)
-            # Set all | filtered users
-            self.all_users = session.exec(query).all()
+        """Set State.var "users" to the current page of the filtered and sorted User DB Model"""
+        # Any newer load makes a search still running in the background stale
+        self._search_seq += 1
+        self.all_users, self.total_users, self.page = load_users_page(
+            self.filter_value, self.sort_value, self.sort_reverse, self.page, self.page_size
+        )
+
+    @rx.event
+    def set_page_number(self, page: int) -> None:
+        """Jump to a page of users"""
+        self.page = page
+        self.set_all_users()
+
+    @rx.event
+    def next_page(self) -> None:
+        """Show the next page of users"""
+        self.set_page_number(self.page + 1)
+
+    @rx.event
+    def previous_page(self) -> None:
+        """Show the previous page of users"""
+        self.set_page_number(self.page - 1)
+
+    @rx.event
+    def set_page_size_value(self, page_size: str) -> None:
+        """Change the number of users per page, keeping the first visible user on screen"""
+        first_row = (self.page - 1) * self.page_size
+        self.page_size = int(page_size)
+        self.page = first_row // self.page_size + 1
+        self.set_all_users()
+
+    def _patch_user_row(self, user_id: int) -> None:
+        """Replace, insert or drop one user's row on the current page instead of reloading the page"""
+        user = load_visible_user(user_id, self.filter_value)
+        old_index = next((index for index, row in enumerate(self.all_users) if row.id == user_id), None)
+        rows = [row for row in self.all_users if row.id != user_id]
+        self.total_users += (user is not None) - (old_index is not None)
+        if user is not None:
+            position = self._row_position(rows, user, old_index)
+            if position is None:
+                # Sorts before the first row, it may belong on the previous page
+                return self.set_all_users()
+            if position < len(rows) or not self._has_later_rows(len(rows)):
+                rows.insert(position, user)
+        self._fill_page(rows)
+
+    def _row_position(self, rows: list[UserRow], user: UserRow, old_index: int | None) -> int | None:
+        """Where user sorts on the current page, None when that is ambiguous with the previous page"""
+        if self.sort_value == "" and search.match_query(self.filter_value):
+            # Search results may be ranked, keep the row where it was
+            return old_index if old_index is not None else len(rows)
+
+        def sort_key(row: UserRow) -> tuple:
+            value = getattr(row, self.sort_value) if self.sort_value != "" else None
+            # NULLs sort first like SQLite, id breaks ties as in load_users_page
+            return (value is not None, value, row.id)
+
+        key = sort_key(user)
+        position = next(
+            (
+                index
+                for index, row in enumerate(rows)
+                if (sort_key(row) < key if self.sort_reverse else sort_key(row) > key)
+            ),
+            len(rows),
+        )
+        if position == 0 and self.page > 1:
+            return None
+        return position
+
+    def _has_later_rows(self, page_rows: int) -> bool:
+        """Whether rows exist after the first page_rows rows of the current page"""
+        return (self.page - 1) * self.page_size + page_rows < self.total_users
+
+    def _fill_page(self, rows: list[UserRow]) -> None:
+        """Set the page rows, pulling up the next row when one left a full page"""
+        if not rows and self.page > 1:
+            return self.set_all_users()
+        if len(rows) < self.page_size and self._has_later_rows(len(rows)):
+            offset = (self.page - 1) * self.page_size + len(rows)
+            next_rows, _, _ = load_users_page(
+                self.filter_value, self.sort_value, self.sort_reverse, offset + 1, page_size=1
+            )
+            rows = rows + [row for row in next_rows if row.id not in {row.id for row in rows}]
+        self.all_users = rows
+
+    def _remove_user_row(self, user_id: int) -> None:
+        """Drop a deleted user's row from the current page"""
+        rows = [row for row in self.all_users if row.id != user_id]
+        self.total_users -= len(self.all_users) - len(rows)
+        self._fill_page(rows)
 
     @rx.event
-    def set_current_user(self, user: User) -> None:
-        """Set State.var "user" from User DB Model"""
+    def open_user_dialog(self, dialog: str, user_id: int) -> rx.Component | None:
+        """Load the selected user and open one of the shared page level user dialogs"""
         with rx.session() as session:
-            statement = select(User).options(selectinload(User.sections)).where(User.id == user.id)
-            self.current_user = session.exec(statement).unique().first()
-            self.current_user_sections = {section.key: True for section in self.current_user.sections}
+            statement = select(User).options(selectinload(User.sections)).where(User.id == user_id)
+            user = session.exec(statement).unique().first()
+        if user is None:
+            self.user_dialog = ""
+            self._remove_user_row(user_id)
+            return rx.toast.error("User not found")
+        self.current_user = user
+        self.current_user_sections = {section.key: True for section in user.sections}
+        if dialog == "sections":
+            self.set_all_sections()
+        # Set last, the dialog content mounts with the selected user's values as its defaults
+        self.user_dialog = dialog
+
+    @rx.event
+    def close_user_dialog(self, open: bool = False) -> None:
+        """Close the user dialog, on_open_change of the shared dialogs"""
+        if not open:
+            self.user_dialog = ""
+            self.current_user_sections = {}
 
     @rx.event
     def unset_current_user_sections(self) -> None:
         """Get the current user's sections"""
         self.current_user_sections = {}
 
-    @rx.event
-    def set_filter_values(self, search_input_value: str) -> None:
-        """Filter users based on the search value"""
-        self.filter_value = search_input_value
-        self.set_all_users()
+    @rx.event(background=True)
+    async def set_filter_values(self, search_input_value: str) -> None:
+        """Filter users based on the search value, results of an outdated search are dropped"""
+        async with self:
+            self.filter_value = search_input_value
+            self.page = 1
+            self._search_seq += 1
+            search_seq = self._search_seq
+            params = (self.filter_value, self.sort_value, self.sort_reverse, self.page, self.page_size)
+        # Query off the event loop and without the state lock, so newer keystrokes are not queued behind it
+        users, total_users, page = await offload.run_sync(load_users_page, *params)
+        async with self:
+            if search_seq != self._search_seq:
+                return
+            self.all_users, self.total_users, self.page = users, total_users, page
 
     @rx.event
     def set_toggle_sort(self) -> None:
         """Toggle the sort order"""
         self.sort_reverse = not self.sort_reverse
+        self.page = 1
         self.set_all_users()
 
     @rx.event
     def set_sort_values(self, display_name: str) -> None:
         """Convert display name to database field name"""
         self.sort_value = self._FIELD_MAPPING.get(display_name, "")
+        self.page = 1
         self.set_all_users()
 
     @rx.event
@@ -115,11 +234,13 @@ class UserState(rx.State):
                 setattr(user, "name", self.form_data["name"])
                 setattr(user, "never_expire", self.form_data["never_expire"])
                 session.add(user)
-                session.commit()
                 if user.plex_id is not None:
-                    # Update the user in Plex, Must be list
-                    plex_connector.update_user_access([user])
-                self.set_all_users()
+                    # Sent to Plex by the outbox worker, committed with the change so the two never diverge
+                    outbox.enqueue(session, "update_access", user)
+                session.commit()
+                outbox.outbox_worker.notify()
+                expiry_scheduler.schedule(user.id, user.expiry_date, user.never_expire)
+                self._patch_user_row(user.id)
                 return rx.toast.success("User successfully updated")
             except Exception as e:
                 session.rollback()
@@ -140,11 +261,11 @@ class UserState(rx.State):
                 sections = session.exec(select(Section).filter(Section.key.in_(section_keys))).all()
                 user.sections = sections
                 session.add(user)
-                session.commit()
                 if user.plex_id is not None:
-                    # Update the user in Plex, Must be list
-                    plex_connector.update_user_access([user])
-                self.set_all_users()
+                    outbox.enqueue(session, "update_access", user)
+                session.commit()
+                outbox.outbox_worker.notify()
+                # Sections are not shown in the table, the page stays as it is
                 return rx.toast.success(
                     f"Successfully set users sections to: {[name for name in self.form_data.keys()]}"
                 )
@@ -153,17 +274,19 @@ class UserState(rx.State):
                 return rx.toast.error(f"Error updating user sections: {e}")
 
     @rx.event
-    def delete_user(self, user: User) -> rx.Component:
-        """Delete a user from the database."""
+    def delete_user(self) -> rx.Component:
+        """Delete the user selected in the dialog from the database."""
+        user = self.current_user
         with rx.session() as session:
             try:
                 user_to_delete = session.exec(select(User).where(User.id == user.id)).one_or_none()
                 if user_to_delete.plex_id is not None:
                     # Disable the user in Plex
-                    plex_connector.update_user_access([user], delete=True)
+                    outbox.enqueue(session, "revoke_access", user_to_delete)
                 session.delete(user_to_delete)
                 session.commit()
-                self.set_all_users()
+                outbox.outbox_worker.notify()
+                self._remove_user_row(user.id)
                 return rx.toast.success(f"User {user.email} successfully deleted")
             except Exception as e:
                 session.rollback()
@@ -194,31 +317,38 @@ class UserState(rx.State):
             sections = session.exec(select(Section).where(Section.key.in_(section_keys))).all()
             self.current_user.sections = sections
             try:
-                # Send to plex server
-                plex_connector.invite_new_user(self.current_user, sections)
-                # add the user to the database
+                # add the user to the database, the invite is sent to plex by the outbox worker
                 session.add(self.current_user)
+                outbox.enqueue(session, "invite", self.current_user)
                 session.commit()
                 session.refresh(self.current_user)
+                outbox.outbox_worker.notify()
 
-                self.set_all_users()
-                return rx.toast.success(f"User {self.current_user.email} successfully invited")
+                expiry_scheduler.schedule(
+                    self.current_user.id, self.current_user.expiry_date, self.current_user.never_expire
+                )
+                self._patch_user_row(self.current_user.id)
+                return rx.toast.success(
+                    f"User {self.current_user.email} added, the Plex invite is on its way, a refusal shows on their row"
+                )
             except Exception as e:
                 session.rollback()
                 return rx.toast.error(f"Error inviting user: {e}")
 
     @rx.event
-    def uninvite_user(self, user: User) -> rx.Component:
-        """Uninvite a user from the Plex server."""
+    def uninvite_user(self) -> rx.Component:
+        """Uninvite the user selected in the dialog from the Plex server."""
+        user = self.current_user
         with rx.session() as session:
             try:
                 user_to_delete = session.exec(select(User).where(User.id == user.id)).one_or_none()
                 if user_to_delete.plex_id is not None:
                     # Disable the user in Plex
-                    plex_connector.uninvite_user(user)
+                    outbox.enqueue(session, "uninvite", user_to_delete)
                 session.delete(user_to_delete)
                 session.commit()
-                self.set_all_users()
+                outbox.outbox_worker.notify()
+                self._remove_user_row(user.id)
                 return rx.toast.success(f"User {user.email} successfully uninvited")
             except Exception as e:
                 session.rollback()
@@ -228,3 +358,67 @@ class UserState(rx.State):
 ######################
 ## Helper functions ##
 ######################
+
+
+def load_users_page(
+    filter_value: str, sort_value: str, sort_reverse: bool, page: int, page_size: int
+) -> tuple[list[UserRow], int, int]:
+    """Load one page of filtered and sorted users, returns (rows, total_users, clamped page)."""
+    with rx.session() as session:
+        query = select(*UserRow.columns())
+        count_query = select(func.count(User.id)).select_from(User)
+        rank = None
+        # Filter based on search input value, ranked prefix search when the FTS5 index exists
+        search_query = search.match_query(filter_value)
+        if search_query and search.fts_enabled(session.get_bind()):
+            match = search.user_fts_match(search_query)
+            query = query.join(search.user_fts, search.user_fts.c.rowid == User.id).where(match)
+            count_query = select(func.count()).select_from(search.user_fts).where(match)
+            rank = search.user_fts.c.rank
+        elif filter_value.strip():
+            # Input without words, like "@@", has no FTS5 query but still filters
+            condition = _ilike_search(filter_value)
+            query = query.where(condition)
+            count_query = count_query.where(condition)
+        total_users = session.exec(count_query).one()
+        # Clamp the page, rows may have been deleted or filtered away
+        page = min(max(1, page), max(1, math.ceil(total_users / page_size)))
+        # Sort based on the selected column or the search rank, id breaks ties so pages never overlap
+        if sort_value != "":
+            sort_column = getattr(User, sort_value)
+            order = desc(sort_column) if sort_reverse else asc(sort_column)
+            query = query.order_by(order)
+        elif rank is not None and total_users <= search.RANKED_MATCHES:
+            query = query.order_by(rank)
+        query = query.order_by(desc(User.id) if sort_reverse else asc(User.id))
+        # Current page of all | filtered users
+        query = query.offset((page - 1) * page_size).limit(page_size)
+        return [_user_row(row) for row in session.exec(query).all()], total_users, page
+
+
+def load_visible_user(user_id: int, filter_value: str) -> UserRow | None:
+    """Load one user's row, None when it was deleted or no longer matches the search."""
+    with rx.session() as session:
+        query = select(*UserRow.columns()).where(User.id == user_id)
+        search_query = search.match_query(filter_value)
+        if search_query and search.fts_enabled(session.get_bind()):
+            matches = select(search.user_fts.c.rowid).where(search.user_fts_match(search_query))
+            query = query.where(User.id.in_(matches))
+        elif filter_value.strip():
+            query = query.where(_ilike_search(filter_value))
+        row = session.exec(query).one_or_none()
+        return None if row is None else _user_row(row)
+
+
+def _ilike_search(filter_value: str) -> ColumnElement[bool]:
+    """Substring search over name, username and email for databases without the FTS5 index."""
+    pattern = f"%{filter_value.lower()}%"
+    return or_(User.name.ilike(pattern), User.username.ilike(pattern), User.email.ilike(pattern))
+
+
+def _user_row(row) -> UserRow:
+    """UserRow from a selected row, its avatar pointing at the local avatar cache."""
+    values = list(row)
+    values[AVATAR_COLUMN] = avatars.avatar_src(values[AVATAR_COLUMN])
+    # Positional, reflex wraps dataclasses in a pydantic init that rejects keywords on slotted ones
+    return UserRow(*values)
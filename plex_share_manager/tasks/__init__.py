@@ -1,5 +1,14 @@
-from .daily import daily_tasks
+from .scheduler import expiry_scheduler, expiry_tasks
+from .cron import cron_tasks
+from .leader import leader_lease
+from .lifespan import leader_tasks
+from . import outbox
 
 __all__ = [
-    "daily_tasks",
+    "expiry_scheduler",
+    "expiry_tasks",
+    "cron_tasks",
+    "leader_lease",
+    "leader_tasks",
+    "outbox",
 ]
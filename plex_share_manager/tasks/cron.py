@@ -0,0 +1,155 @@
+# Cron schedules of the full sweep tasks, the expressions come from config.toml
+
+# Local modules
+from .daily import disable_expired_users, update_user_status
+from .runs import TaskResult, last_started, record_run
+from ..utils import offload
+from rxconfig import logger, config_state
+
+# stdlib
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+# dependencies
+
+# Constants
+# (name, lowest, highest) of the five fields: minute hour day-of-month month day-of-week
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 7))
+MAX_YEARS = 5  # next_after gives up on expressions that never match, like 30 February
+MAX_SLEEP = 3600  # s, wake up at least this often so schedule changes in config.toml are picked up
+
+
+@dataclass(frozen=True)
+class Cron:
+    """Parsed "minute hour day-of-month month day-of-week" expression, day of week 0 is Sunday."""
+
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]
+    # Cron runs on either day field when both are restricted, and on the restricted one otherwise
+    any_day: bool
+    any_weekday: bool
+
+    @classmethod
+    def parse(cls, expression: str) -> "Cron":
+        """Parse fields made of *, numbers, a-b ranges, comma lists and /step, raise ValueError if invalid."""
+        parts = expression.split()
+        if len(parts) != len(FIELDS):
+            raise ValueError(f"Cron expression {expression!r} needs {len(FIELDS)} fields, got {len(parts)}")
+        minutes, hours, days, months, weekdays = (_parse_field(part, *field) for part, field in zip(parts, FIELDS))
+        # 7 is Sunday too
+        weekdays = frozenset(day % 7 for day in weekdays)
+        return cls(minutes, hours, days, months, weekdays, parts[2] == "*", parts[4] == "*")
+
+    def matches_day(self, day: datetime) -> bool:
+        in_days = day.day in self.days
+        in_weekdays = (day.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """First time matching the expression strictly after the given time, to the minute."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * MAX_YEARS)
+        while moment <= limit:
+            if moment.month not in self.months:
+                # Jump to the first day of the next month
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.matches_day(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches within {MAX_YEARS} years")
+
+
+def _parse_field(part: str, name: str, lowest: int, highest: int) -> frozenset[int]:
+    values: set[int] = set()
+    for item in part.split(","):
+        span, _, step = item.partition("/")
+        try:
+            if span == "*":
+                start, end = lowest, highest
+            elif "-" in span:
+                start, end = (int(value) for value in span.split("-", 1))
+            else:
+                start = end = int(span)
+            # A single value with a step runs from it to the end of the field, like cron
+            if step and span != "*" and "-" not in span:
+                end = highest
+            stride = int(step) if step else 1
+        except ValueError:
+            raise ValueError(f"Invalid {name} field {part!r}") from None
+        if not lowest <= start <= end <= highest or stride < 1:
+            raise ValueError(f"Invalid {name} field {part!r}, allowed {lowest}-{highest}")
+        values.update(range(start, end + 1, stride))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronTask:
+    name: str
+    enable_setting: str
+    schedule_setting: str
+    run: Callable[[], Awaitable[TaskResult]]
+
+
+CRON_TASKS = (
+    CronTask(
+        "update_status",
+        "ENABLE_UPDATE_STATUS_TASK",
+        "UPDATE_STATUS_SCHEDULE",
+        lambda: offload.run_sync(update_user_status),
+    ),
+    CronTask(
+        "disable_expired_users",
+        "ENABLE_DISABLE_EXPIRED_USERS_TASK",
+        "DISABLE_EXPIRED_USERS_SCHEDULE",
+        disable_expired_users,
+    ),
+)
+
+
+async def run_due_tasks(now: datetime) -> datetime:
+    """Run the enabled tasks that are due, return when the next one is.
+
+    A task is due when its schedule fired since the start of its last finished run, so runs missed while the
+    app was stopped are caught up once on startup, and a restart does not repeat a run.
+    """
+    wake_at = now + timedelta(seconds=MAX_SLEEP)
+    for task in CRON_TASKS:
+        if not config_state.app_settings[task.enable_setting]:
+            continue
+        try:
+            cron = Cron.parse(config_state.app_settings[task.schedule_setting])
+        except ValueError as e:
+            logger.error(f"Invalid {task.schedule_setting}: {e}")
+            continue
+        last = await offload.run_sync(last_started, task.name)
+        due = cron.next_after(last) if last else now
+        if due <= now:
+            # However many runs were missed, one catches up
+            logger.info(f"Running {task.name}, due since {due}")
+            await record_run(task.name, task.run)
+            due = cron.next_after(datetime.now())
+        wake_at = min(wake_at, due)
+    return wake_at
+
+
+async def cron_tasks() -> None:
+    logger.info("Starting cron tasks")
+    try:
+        while True:
+            wake_at = await run_due_tasks(datetime.now())
+            await asyncio.sleep(max((wake_at - datetime.now()).total_seconds(), 0))
+    except Exception as e:
+        logger.error(f"Failed to run cron tasks: {e}")
+    logger.info("Cron tasks stopped")
@@ -1,56 +1,122 @@
 # Local modules
 from ..models import User
-from ..utils import plex_connector
+from ..utils import offload, plex_async
 from ..utils import utils
-from rxconfig import logger, config_state
+from .runs import TaskResult
+from rxconfig import logger
 
 # stdlib
 import asyncio
+from datetime import date, timedelta
+from typing import Iterator
 
 # dependencies
 import reflex as rx
-from sqlmodel import select
+from sqlalchemy import case, ColumnElement
+from sqlalchemy.orm import selectinload
+from sqlmodel import func, select, update, or_
 
+# Constants
+EXPIRE_BATCH_SIZE = 200  # Users sent to Plex per batch, progress is recorded after each one
+ID_CHUNK_SIZE = 500  # Stay well under SQLite's bound parameter limit
+# The cron sweep and the scheduler catch-up both disable expired users, one at a time so no user is sent to Plex twice
+_disable_lock = asyncio.Lock()
 
-async def daily_tasks() -> None:
-    logger.info("Starting daily tasks")
-    try:
-        while True:
-            if config_state.app_settings["ENABLE_UPDATE_STATUS_TASK"]:
-                update_user_status()
-            if config_state.app_settings["ENABLE_DISABLE_EXPIRED_USERS_TASK"]:
-                disable_expired_users()
-            await asyncio.sleep(86400)
-    except Exception as e:
-        logger.error(f"Failed to run daily tasks: {e}")
-    logger.info("Daily tasks stopped")
 
-
-def update_user_status() -> None:
+def update_user_status(today: date | None = None, user_ids: list[int] | None = None) -> TaskResult:
+    """Recompute the status of every user, or only user_ids, against one reference date."""
     logger.info("Updating user statuses")
+    today = today or date.today()
+    result = TaskResult()
     try:
         with rx.session() as session:
-            users = session.exec(select(User)).all()
-            for user in users:
-                user.expiry_date, user.status = utils.user_status_and_expiry(user.expiry_date, user.never_expire)
-                session.add(user)
+            status = user_status_case(today)
+            for scope in _id_scopes(user_ids):
+                result.examined += session.exec(select(func.count()).select_from(User).where(*scope)).one()
+                # Users without an expiry date get the default one, like utils.user_status_and_expiry
+                session.exec(
+                    update(User)
+                    .where(User.expiry_date.is_(None), *scope)
+                    .values(expiry_date=utils.default_expiry_date(today))
+                )
+                # Only rows whose status changes are written
+                updated = session.exec(
+                    update(User).where(User.status.is_distinct_from(status), *scope).values(status=status)
+                )
+                result.changed += updated.rowcount
             session.commit()
     except Exception as e:
         logger.error(f"Failed to update user statuses: {e}")
-    logger.info("User statuses updated")
+        result.error = str(e)
+    logger.info(f"User statuses updated, {result.changed} changed")
+    return result
+
 
+def user_status_case(today: date) -> ColumnElement[str]:
+    """SQL version of the status rule in utils.user_status_and_expiry."""
+    return case(
+        (User.never_expire.is_(True), "never"),
+        (User.expiry_date < today, "expired"),
+        (User.expiry_date <= today + timedelta(days=utils.EXPIRING_DAYS), "expiring"),
+        else_="active",
+    )
 
-def disable_expired_users() -> None:
+
+async def disable_expired_users(today: date | None = None, user_ids: list[int] | None = None) -> TaskResult:
+    """Apply the expired access for users who expired since it was last applied, changed counts the applied ones."""
     logger.info("Disabling expired users")
-    expired_users: list[User] = []
-    try:
-        with rx.session() as session:
-            users = session.exec(select(User)).all()
-            for user in users:
-                # only pass expired users to the disable_users function
-                if user.status == "expired" and user.never_expire is False:
-                    expired_users.append(user)
-        plex_connector.update_user_access(expired_users)
-    except Exception as e:
-        logger.error(f"Failed to disable expired users: {e}")
+    today = today or date.today()
+    result = TaskResult()
+    # The users are read under the lock, a sweep that waited sees what the other one marked applied
+    async with _disable_lock:
+        try:
+            expired_users = await offload.run_sync(_unapplied_expired_users, user_ids)
+            result.examined = len(expired_users)
+            for batch in utils.chunked(expired_users, EXPIRE_BATCH_SIZE):
+                access = await plex_async.update_user_access(batch)
+                # Skipped users already had the expired access in Plex, only failures are retried on the next pass
+                done = [user.id for user in batch if user.email not in access.failed]
+                await offload.run_sync(_mark_applied, done, today)
+                result.changed += len(done)
+                if access.failed:
+                    logger.warning(f"Failed to disable {len(access.failed)} users: {', '.join(sorted(access.failed))}")
+                    result.error = f"Failed to disable {len(access.failed)} users"
+            logger.info(f"Disabled {result.changed} newly expired users of {len(expired_users)}")
+        except Exception as e:
+            logger.error(f"Failed to disable expired users: {e}")
+            result.error = str(e)
     logger.info("Expired users disabled")
+    return result
+
+
+def _unapplied_expired_users(user_ids: list[int] | None) -> list[User]:
+    expired_users: list[User] = []
+    with rx.session() as session:
+        for scope in _id_scopes(user_ids):
+            # Users already handled since their current expiry date are not sent to Plex again
+            expired_users += session.exec(
+                select(User)
+                .options(selectinload(User.sections))
+                .where(
+                    User.status == "expired",
+                    User.never_expire.is_(False),
+                    or_(User.access_applied_on.is_(None), User.access_applied_on <= User.expiry_date),
+                    *scope,
+                )
+            ).all()
+    return expired_users
+
+
+def _mark_applied(user_ids: list[int], today: date) -> None:
+    with rx.session() as session:
+        session.exec(update(User).where(User.id.in_(user_ids)).values(access_applied_on=today))
+        session.commit()
+
+
+def _id_scopes(user_ids: list[int] | None) -> Iterator[list[ColumnElement[bool]]]:
+    """Extra WHERE criteria limiting a statement to user_ids a chunk at a time, nothing limits it when None."""
+    if user_ids is None:
+        yield []
+        return
+    for ids in utils.chunked(user_ids, ID_CHUNK_SIZE):
+        yield [User.id.in_(ids)]
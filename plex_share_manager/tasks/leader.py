@@ -0,0 +1,129 @@
+# Leader lease in Redis, only the worker holding it runs the scheduled tasks
+
+# Local modules
+from ..models import OutboxEntry, TaskRun
+from ..utils import offload
+from rxconfig import logger
+
+# stdlib
+import uuid
+
+# dependencies
+import reflex as rx
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
+from reflex.utils import prerequisites
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import func, select
+
+# Constants
+LEASE_KEY = "psm:leader"
+FENCE_KEY = "psm:leader:fence"
+LEASE_TTL_MS = 10_000  # A dead leader is replaced within this plus RENEW_INTERVAL
+RENEW_INTERVAL = 3  # s, a few renewals fit in one TTL so a slow one does not lose the lease
+
+# Extend or delete the lease only while this worker still holds it
+RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Next fencing token, kept above the highest one recorded in the database in case Redis lost the counter
+FENCE_SCRIPT = """
+local fence = redis.call("INCR", KEYS[1])
+local floor = tonumber(ARGV[1])
+if fence <= floor then
+    fence = floor + 1
+    redis.call("SET", KEYS[1], fence)
+end
+return fence
+"""
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """Lease on LEASE_KEY, held by the worker whose token is stored there until it expires.
+
+    Each acquisition takes a new fencing token from FENCE_KEY, above any token recorded in the database. Task runs
+    and outbox claims record it and refuse to start once a higher one was recorded, so a leader that lost the lease
+    without noticing cannot write after its successor.
+    Without Redis the worker is its own leader.
+    """
+
+    def __init__(self) -> None:
+        self.token = uuid.uuid4().hex
+        # Fencing token while leader, None otherwise and for a local leader
+        self.fence: int | None = None
+        self._redis: Redis | None = None
+        self._renew: AsyncScript | None = None
+        self._next_fence: AsyncScript | None = None
+        self._release: AsyncScript | None = None
+        self._local = False
+
+    @property
+    def is_leader(self) -> bool:
+        return self._local or self.fence is not None
+
+    def _client(self) -> Redis | None:
+        if self._redis is None and not self._local:
+            self._redis = prerequisites.get_redis()
+            if self._redis is None:
+                logger.info("No Redis configured, this worker runs the scheduled tasks")
+                self._local = True
+            else:
+                self._renew = self._redis.register_script(RENEW_SCRIPT)
+                self._next_fence = self._redis.register_script(FENCE_SCRIPT)
+                self._release = self._redis.register_script(RELEASE_SCRIPT)
+        return self._redis
+
+    async def refresh(self) -> bool:
+        """Renew the lease if held, else try to take it, return whether this worker is the leader."""
+        redis = self._client()
+        if redis is None:
+            return True
+        try:
+            if self.fence is not None:
+                renewed = await self._renew(keys=[LEASE_KEY], args=[self.token, LEASE_TTL_MS])
+                if not renewed:
+                    logger.warning(f"Lost the leader lease, fence {self.fence}")
+                    self.fence = None
+            elif await redis.set(LEASE_KEY, self.token, nx=True, px=LEASE_TTL_MS):
+                # A restarted or flushed Redis starts the counter over, the recorded fences keep it ahead
+                floor = await offload.run_sync(highest_recorded_fence)
+                self.fence = await self._next_fence(keys=[FENCE_KEY], args=[floor])
+                logger.info(f"Acquired the leader lease, fence {self.fence}")
+        except (RedisError, SQLAlchemyError) as e:
+            # Another worker takes over once the lease expires, stepping down keeps to one leader
+            if self.fence is not None:
+                logger.warning(f"Stepping down, failed to renew the leader lease: {e}")
+            else:
+                logger.warning(f"Failed to acquire the leader lease: {e}")
+            self.fence = None
+        return self.is_leader
+
+    async def release(self) -> None:
+        """Give the lease up on shutdown so another worker takes over right away."""
+        if self._redis is not None and self.fence is not None:
+            try:
+                await self._release(keys=[LEASE_KEY], args=[self.token])
+            except (RedisError, SQLAlchemyError) as e:
+                logger.warning(f"Failed to release the leader lease: {e}")
+        self.fence = None
+
+
+def highest_recorded_fence() -> int:
+    """Highest fencing token a leader recorded in the database, on a task run or an outbox claim, 0 if none."""
+    with rx.session() as session:
+        task_runs = session.exec(select(func.max(TaskRun.fence))).one() or 0
+        outbox = session.exec(select(func.max(OutboxEntry.fence))).one() or 0
+        return max(task_runs, outbox)
+
+
+leader_lease = LeaderLease()
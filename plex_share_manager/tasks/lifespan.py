@@ -0,0 +1,43 @@
+# Lifespan task of every backend worker, the scheduled tasks only run in the one holding the leader lease
+
+# Local modules
+from .cron import cron_tasks
+from .leader import leader_lease, RENEW_INTERVAL
+from .outbox import outbox_tasks
+from .scheduler import expiry_tasks
+from rxconfig import logger, config_state
+
+# stdlib
+import asyncio
+
+# dependencies
+
+
+async def _stop(running: list[asyncio.Task]) -> None:
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+
+
+async def leader_tasks() -> None:
+    """Keep the leader lease and run the Plex outbox and the enabled scheduled tasks while holding it."""
+    logger.info(f"Starting leader election, worker {leader_lease.token}")
+    # The outbox always runs, event handlers rely on it to reach Plex
+    tasks = [outbox_tasks]
+    if config_state.app_settings["ENABLE_ALL_TASKS"] is True:
+        tasks += [expiry_tasks, cron_tasks]
+    running: list[asyncio.Task] = []
+    try:
+        while True:
+            if await leader_lease.refresh():
+                if not running:
+                    running = [asyncio.create_task(task()) for task in tasks]
+            elif running:
+                logger.info("No longer the leader, stopping the scheduled tasks")
+                await _stop(running)
+                running = []
+            await asyncio.sleep(RENEW_INTERVAL)
+    finally:
+        await _stop(running)
+        await leader_lease.release()
+        logger.info("Leader election stopped")
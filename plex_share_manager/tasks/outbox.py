@@ -0,0 +1,274 @@
+# Plex outbox, event handlers commit their Plex changes as outbox entries and the leader sends them
+
+# Local modules
+from ..models import OutboxEntry, User
+from ..utils import offload, plex_async
+from ..utils.plex_connector import BatchResult
+from .leader import leader_lease
+from rxconfig import logger
+
+# stdlib
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+# dependencies
+import reflex as rx
+from sqlalchemy import exists
+from sqlalchemy.orm import aliased, selectinload
+from sqlmodel import Session, and_, delete, func, or_, select, update
+
+# Constants
+OUTBOX_BATCH_SIZE = 100  # Entries sent per pass, update and revoke entries share one Plex sharing lookup
+POLL_INTERVAL = 2  # s, entries written by other workers are picked up this often
+BACKOFF_BASE = 5  # s, the wait after the first failure, doubled for each one after
+BACKOFF_MAX = 3600  # s
+MAX_ATTEMPTS = 10  # Failures before an entry is dead lettered, about 45 minutes of retries, a rejection is dead at once
+CLAIM_TIMEOUT = timedelta(minutes=5)  # A claim this old was left by a leader that stopped mid-batch, it is sent again
+RETENTION = timedelta(days=7)  # How long sent and superseded entries are kept
+ACTIONS = ("update_access", "revoke_access", "invite", "uninvite")
+
+
+def enqueue(session: Session, action: str, user: User) -> None:
+    """Add a Plex change for a user to the session, it is sent once the caller commits."""
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown outbox action {action!r}")
+    if user.id is None:
+        session.flush()
+    # Whole seconds, the settings page shows them as is
+    now = datetime.now().replace(microsecond=0)
+    session.add(OutboxEntry(action=action, user_id=user.id, email=user.email, next_attempt_at=now, created_at=now))
+
+
+def backoff(attempts: int) -> timedelta:
+    """Wait before the next attempt of an entry that failed attempts times."""
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+class OutboxWorker:
+    """Sends due outbox entries to Plex, only while this worker is the leader."""
+
+    def __init__(self) -> None:
+        self._wake = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def notify(self) -> None:
+        """Wake the worker after a commit, handlers of other workers are picked up by polling."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self) -> None:
+        """Send entries until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        next_prune = datetime.min
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    if datetime.now() >= next_prune:
+                        await offload.run_sync(_prune, datetime.now() - RETENTION)
+                        next_prune = datetime.now() + timedelta(hours=1)
+                    # A full batch means more may be due
+                    if leader_lease.is_leader and await self.drain() == OUTBOX_BATCH_SIZE:
+                        continue
+                except Exception as e:
+                    logger.error(f"Failed to process the Plex outbox: {e}")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+                except TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+
+    async def drain(self, now: datetime | None = None) -> int:
+        """Claim one batch of due entries, send it and record the outcome, return how many were attempted."""
+        now = now or datetime.now()
+        entries = await offload.run_sync(_claim, now, leader_lease.fence, OUTBOX_BATCH_SIZE)
+        if not entries:
+            return 0
+        users = await offload.run_sync(_load_users, [entry.user_id for entry in entries])
+        errors: dict[int, str | None] = {}
+        # Entries Plex rejected, they are dead lettered without a retry
+        rejected: set[int] = set()
+        by_action = {action: [entry for entry in entries if entry.action == action] for action in ACTIONS}
+
+        async def send(group: list[OutboxEntry], call: Callable[[], Awaitable[BatchResult]]) -> None:
+            try:
+                result = await call()
+                errors.update({entry.id: result.failed.get(entry.email) for entry in group})
+                rejected.update(entry.id for entry in group if entry.email in result.permanent)
+            except Exception as e:
+                errors.update({entry.id: str(e) for entry in group})
+                if plex_async.is_permanent(e):
+                    rejected.update(entry.id for entry in group)
+
+        # A user deleted since an update or invite was queued needs neither, the deletion queued its own entry
+        gone = [
+            entry for entry in entries if entry.action in ("update_access", "invite") and entry.user_id not in users
+        ]
+        errors.update({entry.id: None for entry in gone})
+        updates = [entry for entry in by_action["update_access"] if entry.user_id in users]
+        if updates:
+            await send(updates, lambda: plex_async.update_user_access([users[entry.user_id] for entry in updates]))
+        revokes = by_action["revoke_access"]
+        if revokes:
+            expired = [User(email=entry.email, status="expired") for entry in revokes]
+            await send(revokes, lambda: plex_async.update_user_access(expired, delete=True))
+        for entry in by_action["invite"]:
+            if entry.user_id in users:
+                user = users[entry.user_id]
+                await send([entry], lambda: plex_async.invite_new_user(user, user.sections))
+        for entry in by_action["uninvite"]:
+            await send([entry], lambda: plex_async.uninvite_user(User(email=entry.email)))
+        await offload.run_sync(_settle, entries, errors, rejected, datetime.now())
+        return len(entries)
+
+
+def _claim(now: datetime, fence: int | None, limit: int) -> list[OutboxEntry]:
+    """Mark the oldest unsent entry of each email processing for this leader if it is due, and return the claimed ones.
+
+    Nothing is claimed once a newer leader recorded a higher fencing token, like task runs.
+    """
+    with rx.session() as session:
+        highest = session.exec(select(func.max(OutboxEntry.fence))).one()
+        if fence is not None and highest is not None and highest > fence:
+            logger.warning(f"Not sending the Plex outbox, fence {fence} was superseded by a newer leader")
+            return []
+        stale = and_(OutboxEntry.status == "processing", OutboxEntry.claimed_at < now - CLAIM_TIMEOUT)
+        if fence is not None:
+            stale = and_(stale, or_(OutboxEntry.fence.is_(None), OutboxEntry.fence < fence))
+        claimable = or_(OutboxEntry.status == "pending", stale)
+        # A claimed entry holds back the later changes of its email until it is settled
+        oldest = (
+            select(func.min(OutboxEntry.id))
+            .where(OutboxEntry.status.in_(("pending", "processing")))
+            .group_by(OutboxEntry.email)
+        )
+        ids = session.exec(
+            select(OutboxEntry.id)
+            .where(OutboxEntry.id.in_(oldest), OutboxEntry.next_attempt_at <= now, claimable)
+            .order_by(OutboxEntry.id)
+            .limit(limit)
+        ).all()
+        if not ids:
+            return []
+        # One statement, an entry claimed by another leader in the meantime no longer matches
+        session.exec(
+            update(OutboxEntry)
+            .where(OutboxEntry.id.in_(ids), claimable)
+            .values(status="processing", fence=fence, claimed_at=now)
+        )
+        session.commit()
+        return list(
+            session.exec(
+                select(OutboxEntry)
+                .where(
+                    OutboxEntry.id.in_(ids),
+                    OutboxEntry.status == "processing",
+                    OutboxEntry.fence.is_not_distinct_from(fence),
+                    OutboxEntry.claimed_at == now,
+                )
+                .order_by(OutboxEntry.id)
+            ).all()
+        )
+
+
+def _load_users(user_ids: list[int]) -> dict[int, User]:
+    """Users by id with their sections loaded, plex_async reads them after the session closes."""
+    with rx.session() as session:
+        users = session.exec(select(User).options(selectinload(User.sections)).where(User.id.in_(user_ids))).all()
+        return {user.id: user for user in users}
+
+
+def _settle(entries: list[OutboxEntry], errors: dict[int, str | None], rejected: set[int], now: datetime) -> None:
+    """Mark sent entries done, schedule the retry of failed ones or dead letter them, for entries still claimed."""
+    with rx.session() as session:
+        for claimed in entries:
+            entry = session.get(OutboxEntry, claimed.id)
+            if entry.status != "processing" or (entry.fence, entry.claimed_at) != (claimed.fence, claimed.claimed_at):
+                # Taken over after CLAIM_TIMEOUT, the leader holding it now settles it
+                logger.warning(f"Plex {entry.action} for {entry.email} was claimed by another leader")
+                continue
+            error = errors.get(entry.id, "Not attempted")
+            entry.attempts += 1
+            entry.last_error = error
+            entry.processed_at = now
+            if error is None:
+                entry.status = "done"
+            elif entry.id in rejected:
+                entry.status = "dead"
+                logger.error(f"Plex rejected {entry.action} for {entry.email}: {error}")
+            elif entry.attempts >= MAX_ATTEMPTS:
+                entry.status = "dead"
+                logger.error(
+                    f"Gave up on Plex {entry.action} for {entry.email} after {entry.attempts} attempts: {error}"
+                )
+            else:
+                entry.status = "pending"
+                entry.next_attempt_at = now + backoff(entry.attempts)
+                logger.warning(f"Plex {entry.action} for {entry.email} failed, retrying at {entry.next_attempt_at}")
+            session.add(entry)
+            if entry.action == "invite" and entry.status != "pending":
+                _record_invite(session, entry)
+        session.commit()
+
+
+def _record_invite(session: Session, entry: OutboxEntry) -> None:
+    """Show the outcome of an invite on the user's row, the error until an invite is sent."""
+    user = session.get(User, entry.user_id)
+    if user is not None:
+        user.invite_error = entry.last_error
+        session.add(user)
+
+
+def _prune(before: datetime) -> None:
+    with rx.session() as session:
+        session.exec(
+            delete(OutboxEntry).where(OutboxEntry.status.in_(("done", "superseded")), OutboxEntry.processed_at < before)
+        )
+        session.commit()
+
+
+def outbox_summary(limit: int = 20) -> tuple[int, list[OutboxEntry]]:
+    """Count of entries not sent yet and the most recent dead letters, for the settings page."""
+    with rx.session() as session:
+        pending = session.exec(
+            select(func.count()).select_from(OutboxEntry).where(OutboxEntry.status.in_(("pending", "processing")))
+        )
+        dead = session.exec(
+            select(OutboxEntry).where(OutboxEntry.status == "dead").order_by(OutboxEntry.id.desc()).limit(limit)
+        )
+        return pending.one(), list(dead.all())
+
+
+def retry_dead_letters() -> tuple[int, int]:
+    """Queue the dead letters again with fresh attempts, return how many were queued and how many superseded.
+
+    A dead letter with a newer entry for its email is marked superseded instead, the worker sends the oldest entry of
+    an email first so reviving it would undo the newer change.
+    """
+    later = aliased(OutboxEntry)
+    has_newer = exists().where(later.email == OutboxEntry.email, later.id > OutboxEntry.id)
+    with rx.session() as session:
+        superseded = session.exec(
+            update(OutboxEntry).where(OutboxEntry.status == "dead", has_newer).values(status="superseded")
+        )
+        retried = session.exec(
+            update(OutboxEntry)
+            .where(OutboxEntry.status == "dead")
+            .values(status="pending", attempts=0, next_attempt_at=datetime.now())
+        )
+        session.commit()
+        return retried.rowcount, superseded.rowcount
+
+
+outbox_worker = OutboxWorker()
+
+
+async def outbox_tasks() -> None:
+    logger.info("Starting Plex outbox worker")
+    try:
+        await outbox_worker.run()
+    except Exception as e:
+        logger.error(f"Failed to run Plex outbox worker: {e}")
+    logger.info("Plex outbox worker stopped")
@@ -0,0 +1,89 @@
+# Task run history, every scheduled run is recorded in the task_run table
+
+# Local modules
+from ..models import TaskRun
+from .leader import leader_lease
+from ..utils import offload
+from rxconfig import logger
+
+# stdlib
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable
+
+# dependencies
+import reflex as rx
+from sqlmodel import func, select
+
+
+@dataclass
+class TaskResult:
+    """What a task run looked at and changed, error is set when it failed."""
+
+    examined: int = 0
+    changed: int = 0
+    error: str | None = None
+
+
+def _now() -> datetime:
+    # Whole seconds, the settings page shows them as is
+    return datetime.now().replace(microsecond=0)
+
+
+def _start(task: str, fence: int | None) -> int | None:
+    """Insert the run, or return None if a newer leader already recorded a higher fencing token."""
+    with rx.session() as session:
+        highest = session.exec(select(func.max(TaskRun.fence))).one()
+        if fence is not None and highest is not None and highest > fence:
+            return None
+        run = TaskRun(task=task, started_at=_now(), fence=fence)
+        session.add(run)
+        session.commit()
+        return run.id
+
+
+def _finish(run_id: int, duration_ms: int, result: TaskResult) -> None:
+    with rx.session() as session:
+        run = session.get(TaskRun, run_id)
+        run.finished_at = _now()
+        run.duration_ms = duration_ms
+        run.rows_examined = result.examined
+        run.rows_changed = result.changed
+        run.error = result.error
+        session.add(run)
+        session.commit()
+
+
+async def record_run(task: str, run: Callable[[], Awaitable[TaskResult]]) -> TaskResult:
+    """Run a task and record its start, end, duration, row counts and error in task_run."""
+    run_id = await offload.run_sync(_start, task, leader_lease.fence)
+    if run_id is None:
+        logger.warning(f"Not running {task}, fence {leader_lease.fence} was superseded by a newer leader")
+        return TaskResult(error="Superseded by a newer leader")
+    start = time.perf_counter()
+    try:
+        result = await run()
+    except Exception as e:
+        logger.error(f"Task {task} failed: {e}")
+        result = TaskResult(error=str(e))
+    duration_ms = round((time.perf_counter() - start) * 1000)
+    await offload.run_sync(_finish, run_id, duration_ms, result)
+    return result
+
+
+def last_started(task: str) -> datetime | None:
+    """Start of the last run of a task that finished, failed runs included, unfinished ones are not."""
+    with rx.session() as session:
+        return session.exec(
+            select(TaskRun.started_at)
+            .where(TaskRun.task == task, TaskRun.finished_at.is_not(None))
+            .order_by(TaskRun.started_at.desc())
+            .limit(1)
+        ).first()
+
+
+def last_runs(limit: int = 20) -> list[TaskRun]:
+    """Most recent runs of all tasks, newest first."""
+    with rx.session() as session:
+        return list(session.exec(select(TaskRun).order_by(TaskRun.started_at.desc()).limit(limit)).all())
@@ -0,0 +1,148 @@
+# Expiry scheduler, wakes at each user's next status boundary instead of sweeping the table once a day
+
+# Local modules
+from ..models import User
+from ..utils import offload, utils
+from .daily import disable_expired_users, update_user_status, user_status_case
+from .leader import leader_lease
+from rxconfig import logger, config_state
+
+# stdlib
+import asyncio
+import heapq
+from datetime import date, datetime, time, timedelta
+
+# dependencies
+import reflex as rx
+from sqlmodel import select
+
+# Constants
+MAX_SLEEP = 3600  # s, wake up at least this often so a changed wall clock is noticed
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def user_boundaries(expiry_date: date | None, never_expire: bool) -> list[datetime]:
+    """Times a user's status changes: to "expiring" EXPIRING_DAYS before the expiry date, to "expired" after it."""
+    if expiry_date is None or never_expire:
+        return []
+    return [
+        _midnight(expiry_date - timedelta(days=utils.EXPIRING_DAYS)),
+        _midnight(expiry_date + timedelta(days=1)),
+    ]
+
+
+class ExpiryScheduler:
+    """Priority queue of upcoming (boundary, user id) transitions, applied as each boundary passes.
+
+    The queue holds the boundaries up to the next midnight, when it is reloaded from the expiry_date index.
+    """
+
+    def __init__(self) -> None:
+        self._queue: list[tuple[datetime, int]] = []
+        self._wake = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._next_reload = datetime.min
+
+    def schedule(self, user_id: int, expiry_date: date | None, never_expire: bool) -> None:
+        """Queue a user's boundaries after its expiry date changed, UserState calls this on update and invite."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._push, user_id, user_boundaries(expiry_date, never_expire))
+
+    def _push(self, user_id: int, boundaries: list[datetime]) -> None:
+        now = datetime.now()
+        for boundary in boundaries:
+            # Later boundaries come with a reload, passed ones are applied right away
+            if boundary <= self._next_reload:
+                heapq.heappush(self._queue, (max(boundary, now), user_id))
+        # Old entries of the user stay queued, applying them again finds nothing to change
+        self._wake.set()
+
+    async def run(self) -> None:
+        """Apply due transitions until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        # Started again after a leader change, the queue may have missed updates meanwhile
+        self._queue = []
+        self._next_reload = datetime.min
+        try:
+            while True:
+                now = datetime.now()
+                due: set[int] = set()
+                while self._queue and self._queue[0][0] <= now:
+                    due.add(heapq.heappop(self._queue)[1])
+                if due:
+                    await apply_transitions(sorted(due), now.date())
+                if now >= self._next_reload:
+                    await self._reload(now)
+                self._wake.clear()
+                wake_at = min(self._queue[0][0], self._next_reload) if self._queue else self._next_reload
+                timeout = min(max((wake_at - datetime.now()).total_seconds(), 0), MAX_SLEEP)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+
+    async def _reload(self, now: datetime) -> None:
+        """Catch up on boundaries passed while stopped, then queue the ones up to the next midnight."""
+        today = now.date()
+        overdue, upcoming = await offload.run_sync(_load_boundaries, today)
+        self._next_reload = _midnight(today + timedelta(days=1))
+        self._queue = [
+            (boundary, user_id)
+            for user_id, expiry_date, never_expire in upcoming
+            for boundary in user_boundaries(expiry_date, never_expire)
+            if now < boundary <= self._next_reload
+        ]
+        heapq.heapify(self._queue)
+        logger.info(f"Expiry scheduler queued {len(self._queue)} boundaries, {len(overdue)} users overdue")
+        await apply_transitions(list(overdue), today, catch_up=True)
+
+
+def _load_boundaries(today: date) -> tuple[list[int], list[tuple[int, date, bool]]]:
+    """Users whose status is behind today, and users with a boundary at the next midnight."""
+    status = user_status_case(today)
+    with rx.session() as session:
+        # Both are range queries on the expiry_date index, never a full table sweep
+        overdue = session.exec(
+            select(User.id).where(
+                User.never_expire.is_(False),
+                User.expiry_date <= today + timedelta(days=utils.EXPIRING_DAYS),
+                User.status.is_distinct_from(status),
+            )
+        ).all()
+        # Boundaries at the next midnight: expires today, or starts expiring tomorrow
+        upcoming = session.exec(
+            select(User.id, User.expiry_date, User.never_expire).where(
+                User.never_expire.is_(False),
+                User.expiry_date.in_([today, today + timedelta(days=utils.EXPIRING_DAYS + 1)]),
+            )
+        ).all()
+    return list(overdue), list(upcoming)
+
+
+async def apply_transitions(user_ids: list[int], today: date, catch_up: bool = False) -> None:
+    """Update the status of users whose boundary passed and disable the ones that expired."""
+    if not leader_lease.is_leader:
+        # Lost the lease, the new leader's scheduler catches up on these
+        return
+    if config_state.app_settings["ENABLE_UPDATE_STATUS_TASK"] and user_ids:
+        await offload.run_sync(update_user_status, today, user_ids)
+    if config_state.app_settings["ENABLE_DISABLE_EXPIRED_USERS_TASK"]:
+        # On catch up every expired user not applied yet is retried, failures of earlier passes included
+        await disable_expired_users(today, None if catch_up else user_ids)
+
+
+expiry_scheduler = ExpiryScheduler()
+
+
+async def expiry_tasks() -> None:
+    logger.info("Starting expiry scheduler")
+    try:
+        await expiry_scheduler.run()
+    except Exception as e:
+        logger.error(f"Failed to run expiry scheduler: {e}")
+    logger.info("Expiry scheduler stopped")
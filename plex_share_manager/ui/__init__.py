@@ -1,9 +1,11 @@
 from .base import base_page
 from .theme import base_theme
+from .virtual_table import virtual_table
 from . import components
 
 __all__ = [
     "base_page",
     "base_theme",
+    "virtual_table",
     "components",
 ]
@@ -30,6 +30,7 @@ def status_badge(status: str) -> rx.Component:
         "expiring": ("check", status, "amber"),
         "expired": ("ban", status, "crimson"),
         "never": ("star", status, "yellow"),
+        "invite failed": ("circle-alert", status, "orange"),
         "default": ("loader", "No info", "blue"),
     }
     return _badge(*badge_mapping.get(status, badge_mapping["default"]))
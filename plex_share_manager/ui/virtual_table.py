@@ -0,0 +1,105 @@
+# Windowed table, only the rows in view are mounted in the browser.
+
+# Local modules
+
+# stdlib
+from typing import Any, Callable
+
+# dependencies
+import reflex as rx
+from reflex.components.component import LiteralComponentVar
+from reflex.vars.base import Var
+from reflex.vars.function import ArgsFunctionOperation
+
+# Constants
+OVERSCAN_PX = 800  # Rows mounted above and below the viewport, keeps fast scrolling from showing blank rows
+
+# Radix Themes table parts, so the virtual table looks like rx.table.root
+_TABLE_PARTS = """
+const VirtualTableParts = {
+  Table: ({ style, ...props }) => <table {...props} className="rt-TableRootTable" style={{ ...style, width: "100%" }} />,
+  TableHead: React.forwardRef((props, ref) => <thead {...props} ref={ref} className="rt-TableHeader" />),
+  TableBody: React.forwardRef((props, ref) => <tbody {...props} ref={ref} className="rt-TableBody" />),
+  TableRow: (props) => <tr {...props} className="rt-TableRow" />,
+};
+"""
+
+
+class TableVirtuoso(rx.Component):
+    """react-virtuoso TableVirtuoso, renders item_content only for the visible rows."""
+
+    library = "react-virtuoso@4.12.3"
+    tag = "TableVirtuoso"
+
+    # The rows, one item_content call per visible row
+    data: rx.Var[list]
+    # (index, item) => the cells of one row
+    item_content: rx.Var[Any]
+    # () => the header row, kept at the top while scrolling
+    fixed_header_content: rx.Var[Any]
+    # (index, item) => stable React key of a row
+    compute_item_key: rx.Var[Any]
+    # Table, TableHead, TableBody and TableRow elements
+    components: rx.Var[Any]
+    # Scroll with the page instead of an inner scroll container
+    use_window_scroll: rx.Var[bool]
+    # Extra pixels rendered above and below the viewport
+    increase_viewport_by: rx.Var[int]
+
+    @classmethod
+    def create(cls, data: Var, row_cells: Callable[[Var], rx.Component], header: rx.Component, **props):
+        """Create the table from the row list, a function rendering the cells of one row and the header row."""
+        item = Var(_js_expr="item", _var_type=data._var_type.__args__[0]).guess_type()
+        cells = row_cells(item)
+        component = super().create(
+            data=data,
+            item_content=ArgsFunctionOperation.create(("_index", "item"), LiteralComponentVar.create(cells)),
+            fixed_header_content=ArgsFunctionOperation.create((), LiteralComponentVar.create(header)),
+            compute_item_key=ArgsFunctionOperation.create(("_index", "item"), item.id),
+            components=Var(_js_expr="VirtualTableParts"),
+            **props,
+        )
+        # Like rx.foreach, keep the templates as children so their imports, hooks and styles are collected
+        component.children = [header, cells]
+        return component
+
+    def add_imports(self) -> dict:
+        return {"react": [rx.ImportVar(tag="React", is_default=True)]}
+
+    def add_custom_code(self) -> list[str]:
+        return [_TABLE_PARTS]
+
+    def render(self) -> dict:
+        # The templates are rendered through item_content and fixed_header_content, not as children
+        return {**super().render(), "children": []}
+
+
+def virtual_table(
+    data: Var,
+    row_cells: Callable[[Var], rx.Component],
+    header: rx.Component,
+    size: str = "3",
+    variant: str = "surface",
+    background: str = "var(--color-panel-solid)",
+    row_hover: dict | None = None,
+    **props,
+) -> rx.Component:
+    """Table with the rx.table look that only mounts the visible rows, scrolling with the page."""
+    style = {
+        # The header sticks to the top of the window, rows must not show through it
+        "& .rt-TableHeader": {"background": background},
+        "& .rt-TableBody .rt-TableRow:hover": row_hover or {},
+    }
+    return rx.box(
+        TableVirtuoso.create(
+            data,
+            row_cells,
+            header,
+            use_window_scroll=True,
+            increase_viewport_by=OVERSCAN_PX,
+        ),
+        class_name=f"rt-TableRoot rt-r-size-{size} rt-variant-{variant}",
+        background=background,
+        style=style,
+        **props,
+    )
@@ -1,6 +1,9 @@
-from . import plex_connector, utils
+from . import avatars, offload, plex_async, plex_connector, utils
 
 __all__ = [
+    "avatars",
+    "offload",
+    "plex_async",
     "plex_connector",
     "utils",
 ]
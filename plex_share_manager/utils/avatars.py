@@ -0,0 +1,213 @@
+# Local avatar cache, plex.tv thumbnails are downsized once and served from the backend
+
+# Local modules
+from . import offload, plex_async
+from rxconfig import config_state, logger
+
+# stdlib
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+# dependencies
+import httpx
+import reflex as rx
+from fastapi import Request, Response
+from fastapi.responses import RedirectResponse
+
+# Constants
+AVATAR_ROUTE = "/avatars"
+AVATAR_DIR = config_state.config_file.parent / "avatars"
+AVATAR_SIZE = 80  # px, twice the rendered avatar for high density screens
+REVALIDATE_AFTER = 7 * 24 * 3600  # s, a cached avatar is served this long before asking upstream again
+TOUCH_AFTER = 24 * 3600  # s, how stale the last use time may get, avoids a disk write per request
+BROWSER_MAX_AGE = 365 * 24 * 3600  # s, the route changes with the URL, which plex.tv versions with ?c=
+ALLOWED_HOSTS = ("plex.tv", "gravatar.com")  # Upstreams the route fetches from, and their subdomains
+_locks: dict[str, tuple[asyncio.Lock, list[int]]] = {}  # One fetch per avatar at a time, with the tasks using it
+_evicting = asyncio.Lock()
+_cache_bytes: int | None = None  # Size of the cache as of the last eviction plus what was written since, None until one
+
+
+def avatar_key(url: str) -> str:
+    """Cache key of an avatar URL."""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def avatar_src(url: str | None) -> str | None:
+    """Local URL the browser loads an avatar from."""
+    if not url:
+        return None
+    return f"{rx.config.get_config().api_url}{AVATAR_ROUTE}/{avatar_key(url)}?{urlencode({'url': url})}"
+
+
+def _paths(key: str) -> tuple[Path, Path]:
+    """Image and metadata file of a cache entry."""
+    return AVATAR_DIR / key, AVATAR_DIR / f"{key}.json"
+
+
+def _read_meta(key: str) -> dict | None:
+    image, meta = _paths(key)
+    try:
+        return json.loads(meta.read_text()) if image.exists() else None
+    except (OSError, ValueError):
+        return None
+
+
+def _write(key: str, meta: dict, content: bytes | None = None) -> None:
+    """Write a cache entry, replacing the files so a reader never sees half of one."""
+    AVATAR_DIR.mkdir(parents=True, exist_ok=True)
+    image, meta_file = _paths(key)
+    if content is not None:
+        tmp = Path(f"{image}.tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, image)
+    tmp = Path(f"{meta_file}.tmp")
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, meta_file)
+
+
+@contextlib.asynccontextmanager
+async def _fetch_lock(key: str):
+    """Hold the lock of one avatar, it is dropped once no task holds or waits for it."""
+    lock, users = _locks.setdefault(key, (asyncio.Lock(), [0]))
+    users[0] += 1
+    try:
+        async with lock:
+            yield
+    finally:
+        users[0] -= 1
+        if users[0] == 0:
+            del _locks[key]
+
+
+def _max_bytes() -> int:
+    return int(config_state.app_settings["AVATAR_CACHE_MAX_MB"]) * 1024 * 1024
+
+
+async def _evict_if_full(written: int) -> None:
+    """Count a write against the cache size and evict once it goes over the limit."""
+    global _cache_bytes
+    if _cache_bytes is not None:
+        _cache_bytes += written
+        if _cache_bytes <= _max_bytes():
+            return
+    # Writes that land during an eviction are counted by its directory scan
+    if not _evicting.locked():
+        async with _evicting:
+            await offload.run_sync(evict)
+
+
+def _allowed(url: str) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == allowed or host.endswith(f".{allowed}") for allowed in ALLOWED_HOSTS)
+
+
+async def get_avatar(url: str) -> tuple[Path, dict] | None:
+    """Return the cached image and metadata of an avatar, fetching or revalidating it when needed."""
+    key = avatar_key(url)
+    async with _fetch_lock(key):
+        meta = await offload.run_sync(_read_meta, key)
+        if meta is not None and time.time() - meta["checked"] < REVALIDATE_AFTER:
+            return _paths(key)[0], meta
+        validators = {}
+        if meta is not None and meta.get("etag"):
+            validators["If-None-Match"] = meta["etag"]
+        if meta is not None and meta.get("last_modified"):
+            validators["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = await plex_async.fetch_avatar(url, AVATAR_SIZE, validators)
+            if response.status_code == 304 and meta is not None:
+                meta["checked"] = time.time()
+                await offload.run_sync(_write, key, meta)
+            elif response.status_code == 200:
+                now = time.time()
+                meta = {
+                    "url": url,
+                    "content_type": response.headers.get("content-type", "image/jpeg"),
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                    "checked": now,
+                    "stored": now,
+                }
+                await offload.run_sync(_write, key, meta, response.content)
+                await _evict_if_full(len(response.content))
+            else:
+                # Only thumbnails are cached, serve_avatar redirects to the allow-listed original
+                logger.warning(f"Photo transcoder returned {response.status_code} for avatar {url}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to fetch avatar {url}: {e}")
+        # A stale copy beats no avatar when upstream is down
+        return (_paths(key)[0], meta) if meta is not None else None
+
+
+async def warm(urls: list[str | None]) -> int:
+    """Fetch the avatars not cached yet a few at a time, evict down to the size limit, return how many are cached."""
+    semaphore = asyncio.Semaphore(max(1, int(config_state.app_settings["PLEX_MAX_WORKERS"])))
+
+    async def fetch(url: str) -> bool:
+        async with semaphore:
+            return await get_avatar(url) is not None
+
+    fetched = await asyncio.gather(*(fetch(url) for url in set(urls) if url and _allowed(url)))
+    await offload.run_sync(evict)
+    return sum(fetched)
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """Delete the least recently used avatars until the cache fits in AVATAR_CACHE_MAX_MB, return how many."""
+    global _cache_bytes
+    if max_bytes is None:
+        max_bytes = _max_bytes()
+    if not AVATAR_DIR.exists():
+        _cache_bytes = 0
+        return 0
+    entries = []
+    for image in AVATAR_DIR.iterdir():
+        if image.suffix:
+            continue
+        try:
+            stat = image.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, image))
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, image in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in _paths(image.name):
+            path.unlink(missing_ok=True)
+        total -= size
+        evicted += 1
+    _cache_bytes = total
+    if evicted:
+        logger.info(f"Evicted {evicted} avatars from the cache")
+    return evicted
+
+
+async def serve_avatar(key: str, url: str, request: Request) -> Response:
+    """Serve a cached avatar, GET AVATAR_ROUTE/{key}?url=..."""
+    if key != avatar_key(url) or not _allowed(url):
+        return Response(status_code=404)
+    cached = await get_avatar(url)
+    if cached is None:
+        return RedirectResponse(url)
+    image, meta = cached
+    etag = f'"{key}-{int(meta["stored"])}"'
+    headers = {"Cache-Control": f"public, max-age={BROWSER_MAX_AGE}, immutable", "ETag": etag}
+    try:
+        # The file time is the last use, eviction drops the oldest first
+        if time.time() - image.stat().st_mtime > TOUCH_AFTER:
+            os.utime(image)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        content = await offload.run_sync(image.read_bytes)
+    except OSError:
+        # Evicted in the meantime
+        return RedirectResponse(url)
+    return Response(content, media_type=meta["content_type"], headers=headers)
@@ -0,0 +1,74 @@
+# Runs blocking database and Plex calls from coroutines in a bounded thread pool, so the event loop keeps
+# serving websocket heartbeats and other users' events meanwhile
+
+# Local modules
+from rxconfig import config_state, logger
+
+# stdlib
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, ParamSpec, TypeVar
+
+# dependencies
+
+# Constants
+SLOW_CALL_MS = 1000  # Calls running longer than this are logged as warnings
+P = ParamSpec("P")
+T = TypeVar("T")
+_executor: ThreadPoolExecutor | None = None
+
+
+@dataclass
+class CallStats:
+    """Timing of the offloaded calls of one function, wait is the time spent queued for a thread."""
+
+    calls: int = 0
+    wait_ms: float = 0
+    run_ms: float = 0
+    max_run_ms: float = 0
+
+
+stats: dict[str, CallStats] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        max_workers = max(1, int(config_state.app_settings["OFFLOAD_MAX_WORKERS"]))
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="psm-offload")
+    return _executor
+
+
+async def run_sync(func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """Run a blocking function in the offload pool and await its result, like asyncio.to_thread."""
+    name = getattr(func, "__qualname__", repr(func))
+    queued = time.perf_counter()
+    started = queued
+
+    def timed_call() -> T:
+        nonlocal started
+        started = time.perf_counter()
+        return func(*args, **kwargs)
+
+    # Context variables follow the call into the thread, like asyncio.to_thread
+    context = contextvars.copy_context()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), functools.partial(context.run, timed_call)
+        )
+    finally:
+        finished = time.perf_counter()
+        wait_ms, run_ms = (started - queued) * 1000, (finished - started) * 1000
+        entry = stats.setdefault(name, CallStats())
+        entry.calls += 1
+        entry.wait_ms += wait_ms
+        entry.run_ms += run_ms
+        entry.max_run_ms = max(entry.max_run_ms, run_ms)
+        if run_ms > SLOW_CALL_MS:
+            logger.warning(f"Offloaded {name} took {run_ms:.0f}ms, queued {wait_ms:.0f}ms")
+        else:
+            logger.debug(f"Offloaded {name} took {run_ms:.0f}ms, queued {wait_ms:.0f}ms")
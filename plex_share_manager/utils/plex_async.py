@@ -0,0 +1,379 @@
+# Async Plex client, mirrors plex_connector for background events and tasks
+
+# Local modules
+from ..models import User, Section
+from ..utils import offload, utils
+from .plex_connector import CONNECTION_TTL, BatchResult, parse_shared_sections, pending_changes, plan_access
+from rxconfig import config_state, logger
+
+# stdlib
+import asyncio
+import contextlib
+from datetime import date
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+from xml.etree import ElementTree
+
+# dependencies
+import httpx
+import plexapi
+import reflex as rx
+from plexapi.exceptions import BadRequest, NotFound, Unauthorized
+from sqlmodel import select
+
+# Constants
+PLEX_TV_URL = "https://plex.tv"
+IMPORT_PAGE_SIZE = 200  # Users handed to the import per page
+_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}  # One pooled client per event loop
+_machine_ids: dict[tuple[str, str], tuple[str, float]] = {}
+
+
+def _client() -> httpx.AsyncClient:
+    """Return the pooled client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    # Clients of loops that ended without close() went down with their loop
+    for stale in [stale for stale in _clients if stale.is_closed()]:
+        del _clients[stale]
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        max_connections = max(1, int(config_state.app_settings["PLEX_MAX_WORKERS"]))
+        client = httpx.AsyncClient(
+            timeout=plexapi.TIMEOUT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close() -> None:
+    """Close the pooled client for the running event loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@contextlib.asynccontextmanager
+async def client_lifespan() -> AsyncIterator[None]:
+    """App lifespan task closing the pooled client of the app's event loop on shutdown."""
+    try:
+        yield
+    finally:
+        await close()
+        logger.info("Closed the Plex HTTP client")
+
+
+def _headers() -> dict[str, str]:
+    headers = dict(plexapi.BASE_HEADERS)
+    headers["X-Plex-Token"] = config_state.app_settings["PLEXAPI_AUTH_SERVER_TOKEN"]
+    return headers
+
+
+class PlexUnavailable(BadRequest):
+    """Plex answered 429 or 5xx, the same request may succeed later."""
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    """Raise the plexapi exception matching a failed response."""
+    if response.status_code not in (200, 201, 204):
+        message = f"({response.status_code}) {response.url} {response.text.replace(chr(10), ' ')}"
+        if response.status_code == 401:
+            raise Unauthorized(message)
+        elif response.status_code == 404:
+            raise NotFound(message)
+        elif response.status_code == 429 or response.status_code >= 500:
+            raise PlexUnavailable(message)
+        raise BadRequest(message)
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether Plex rejected the request itself, timeouts, connection errors and PlexUnavailable are worth a retry."""
+    return isinstance(error, (BadRequest, NotFound, Unauthorized)) and not isinstance(error, PlexUnavailable)
+
+
+def _failed(emails: list[str], error: Exception) -> BatchResult:
+    """BatchResult of a call that failed for every email with one error."""
+    return BatchResult(
+        failed={email: str(error) for email in emails}, permanent=set(emails) if is_permanent(error) else set()
+    )
+
+
+async def _query(url: str, method: str = "GET", **kwargs) -> Any:
+    """Send a request with the Plex headers and parse the body by its Content-Type like plexapi does.
+
+    Returns the XML root element, the decoded JSON, or None for an empty or other body, a 2xx is a success either way.
+    """
+    response = await _client().request(method, url, headers=_headers(), **kwargs)
+    _raise_for_status(response)
+    content_type = response.headers.get("Content-Type", "")
+    if not response.content.strip():
+        return None
+    if "json" in content_type:
+        return response.json()
+    if "xml" in content_type or (not content_type and response.content.lstrip().startswith(b"<")):
+        return ElementTree.fromstring(response.content)
+    return None
+
+
+async def _iter_elements(url: str, tag: str) -> AsyncIterator[ElementTree.Element]:
+    """Stream a response and yield each tag element as soon as it is parsed, then free it."""
+    async with _client().stream("GET", url, headers=_headers()) as response:
+        if response.status_code != 200:
+            await response.aread()
+            _raise_for_status(response)
+        parser = ElementTree.XMLPullParser(events=("end",))
+        async for chunk in response.aiter_bytes():
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if element.tag == tag:
+                    yield element
+                    element.clear()
+
+
+def _server_url(path: str) -> str:
+    return config_state.app_settings["PLEXAPI_AUTH_SERVER_BASEURL"].rstrip("/") + path
+
+
+async def _machine_identifier() -> str:
+    """Return the server's machineIdentifier, cached per (base URL, token) like plex_connector."""
+    key = (
+        config_state.app_settings["PLEXAPI_AUTH_SERVER_BASEURL"],
+        config_state.app_settings["PLEXAPI_AUTH_SERVER_TOKEN"],
+    )
+    cached = _machine_ids.get(key)
+    if cached is not None and time.monotonic() - cached[1] < CONNECTION_TTL:
+        return cached[0]
+    data = await _query(_server_url("/identity"))
+    _machine_ids[key] = (data.attrib["machineIdentifier"], time.monotonic())
+    return _machine_ids[key][0]
+
+
+async def _friends() -> dict[str, ElementTree.Element]:
+    """Map lower-cased email to the friend's User element."""
+    data = await _query(f"{PLEX_TV_URL}/api/users/")
+    return {friend.attrib["email"].lower(): friend for friend in data.iter("User") if friend.attrib.get("email")}
+
+
+async def _section_ids(machine_id: str) -> dict[str, int]:
+    """Map lower-cased section title to the plex.tv id used when sharing."""
+    data = await _query(f"{PLEX_TV_URL}/api/servers/{machine_id}")
+    return {section.attrib["title"].lower(): int(section.attrib["id"]) for section in data.iter("Section")}
+
+
+def _library_ids(section_ids: dict[str, int], titles: list[str]) -> list[int]:
+    """plex.tv ids of library sections by title, NotFound for a title the server lacks since a retry cannot fix it."""
+    ids = []
+    for title in titles:
+        if title.lower() not in section_ids:
+            raise NotFound(f"unknown library section {title!r}")
+        ids.append(section_ids[title.lower()])
+    return ids
+
+
+async def _run_per_user(func: Callable[[str], Awaitable[None]], emails: list[str]) -> BatchResult:
+    """Await func for each email with at most PLEX_MAX_WORKERS requests in flight."""
+    result = BatchResult()
+    semaphore = asyncio.Semaphore(max(1, int(config_state.app_settings["PLEX_MAX_WORKERS"])))
+
+    async def run(email: str) -> None:
+        async with semaphore:
+            try:
+                await func(email)
+                result.succeeded.append(email)
+            except Exception as e:
+                logger.error(f"Failed to update user {email}: {e}")
+                result.failed[email] = str(e)
+                if is_permanent(e):
+                    result.permanent.add(email)
+
+    await asyncio.gather(*(run(email) for email in emails))
+    return result
+
+
+async def get_plex_users() -> list[User]:
+    """Fetch users from Plex server."""
+    users: list[User] = []
+    async for page in iter_plex_users():
+        users.extend(page)
+    return users
+
+
+def _local_sections() -> list[Section]:
+    with rx.session() as session:
+        return list(session.exec(select(Section)).all())
+
+
+async def iter_plex_users(page_size: int = IMPORT_PAGE_SIZE) -> AsyncIterator[list[User]]:
+    """Yield Plex users in pages while the friends listing is still streaming in."""
+    local_sections = await offload.run_sync(_local_sections)
+    shared_task = None
+    try:
+        machine_id = await _machine_identifier()
+        # The shared_servers snapshot downloads while the friends listing streams in
+        shared_task = asyncio.create_task(_query(f"{PLEX_TV_URL}/api/servers/{machine_id}/shared_servers"))
+        shared_sections: dict[str, set[int]] | None = None
+        expiry_date, status = utils.user_status_and_expiry(None, None)
+        friends: list[tuple[int, str, str, str | None]] = []
+        async for friend in _iter_elements(f"{PLEX_TV_URL}/api/users/", "User"):
+            email = friend.attrib.get("email")
+            if not email:
+                continue
+            friends.append(
+                (int(friend.attrib["id"]), friend.attrib.get("title", ""), email, friend.attrib.get("thumb"))
+            )
+            if len(friends) < page_size:
+                continue
+            if shared_sections is None:
+                shared_sections = parse_shared_sections(await shared_task)
+            yield _build_users(friends, shared_sections, local_sections, expiry_date, status)
+            friends = []
+        if friends:
+            if shared_sections is None:
+                shared_sections = parse_shared_sections(await shared_task)
+            yield _build_users(friends, shared_sections, local_sections, expiry_date, status)
+    except Exception as e:
+        logger.error(f"Failed to fetch Plex users: {e}")
+        raise e
+    finally:
+        if shared_task is not None and not shared_task.done():
+            shared_task.cancel()
+
+
+def _build_users(
+    friends: list[tuple[int, str, str, str | None]],
+    shared_sections: dict[str, set[int]],
+    local_sections: list[Section],
+    expiry_date: date,
+    status: str,
+) -> list[User]:
+    """Turn (plex_id, username, email, thumb) rows into new User records with their shared sections."""
+    users: list[User] = []
+    for plex_id, username, email, thumb in friends:
+        user_sections = shared_sections.get(email.lower(), set())
+        users.append(
+            User(
+                plex_id=plex_id,
+                username=username,
+                email=email,
+                expiry_date=expiry_date,
+                status=status,
+                avatar_url=thumb,
+                sections=[section for section in local_sections if section.key in user_sections],
+                invite_pending=False,
+            )
+        )
+    return users
+
+
+async def get_plex_sections() -> list[Section]:
+    """Fetch library sections from Plex server."""
+    sections: list[Section] = []
+    try:
+        data = await _query(_server_url("/library/sections"))
+        for directory in data.iter("Directory"):
+            sections.append(Section(key=int(directory.attrib["key"]), title=directory.attrib["title"]))
+    except Exception as e:
+        logger.error(f"Failed to fetch Plex sections: {e}")
+    return sections
+
+
+async def update_user_access(users: list[User], delete=False) -> BatchResult:
+    """Update user access to Plex library sections, skipping users whose access already matches.
+
+    Callers load the users' sections eagerly, plan_access runs on the thread pool and must not lazy load.
+    """
+    plans = await offload.run_sync(plan_access, users, delete)
+    try:
+        machine_id = await _machine_identifier()
+        friends, section_ids, shared_data = await asyncio.gather(
+            _friends(),
+            _section_ids(machine_id),
+            _query(f"{PLEX_TV_URL}/api/servers/{machine_id}/shared_servers"),
+        )
+    except Exception as e:
+        logger.error(f"Failed to fetch Plex friends: {e}")
+        return _failed(list(plans), e)
+
+    allow_sync = {email: friend.attrib.get("allowSync") == "1" for email, friend in friends.items()}
+    changed = pending_changes(plans, parse_shared_sections(shared_data), allow_sync)
+
+    async def update_friend(email: str) -> None:
+        friend = friends.get(email.lower())
+        if friend is None:
+            raise NotFound(f"{email} is not a Plex friend")
+        access = plans[email]
+        ids = _library_ids(section_ids, access.titles)
+        shares = [server for server in friend.iter("Server") if server.attrib.get("machineIdentifier") == machine_id]
+        if shares and ids:
+            url = f"{PLEX_TV_URL}/api/servers/{machine_id}/shared_servers/{shares[0].attrib['id']}"
+            params = {"server_id": machine_id, "shared_server": {"library_section_ids": ids}}
+            await _query(url, "PUT", json=params)
+        elif ids:
+            url = f"{PLEX_TV_URL}/api/servers/{machine_id}/shared_servers"
+            params = {
+                "server_id": machine_id,
+                "shared_server": {"library_section_ids": ids, "invited_id": friend.attrib["id"]},
+            }
+            await _query(url, "POST", json=params)
+        if access.allow_sync is not None:
+            await _query(
+                f"{PLEX_TV_URL}/api/v2/sharings/{friend.attrib['id']}",
+                "PUT",
+                params={"allowSync": "1" if access.allow_sync else "0"},
+            )
+
+    result = await _run_per_user(update_friend, changed)
+    result.skipped = len(plans) - len(changed)
+    logger.info(f"Updated {len(changed)} Plex users, skipped {result.skipped} unchanged")
+    return result
+
+
+async def invite_new_user(user: User, sections: list[Section]) -> BatchResult:
+    """Invite a new user to the Plex server."""
+    titles = [section.title for section in sections]
+    try:
+        machine_id = await _machine_identifier()
+        section_ids = await _section_ids(machine_id)
+    except Exception as e:
+        logger.error(f"Failed to invite user {user.email}: {e}")
+        return _failed([user.email], e)
+
+    async def invite_friend(email: str) -> None:
+        params = {
+            "server_id": machine_id,
+            "shared_server": {"library_section_ids": _library_ids(section_ids, titles), "invited_email": email},
+            "sharing_settings": {"allowSync": "1" if config_state.app_settings["ALLOW_SYNC"] else "0"},
+        }
+        await _query(f"{PLEX_TV_URL}/api/servers/{machine_id}/shared_servers", "POST", json=params)
+
+    return await _run_per_user(invite_friend, [user.email])
+
+
+async def uninvite_user(user: User) -> BatchResult:
+    """Uninvite a user from the Plex server."""
+    try:
+        data = await _query(f"{PLEX_TV_URL}/api/invites/requested")
+        invite = next(
+            invite
+            for invite in data.iter("Invite")
+            if user.email.lower() in (invite.attrib.get("email", "").lower(), invite.attrib.get("username", "").lower())
+        )
+        params = {key: int(invite.attrib.get(key, 0)) for key in ("friend", "home", "server")}
+        await _query(f"{PLEX_TV_URL}/api/invites/requested/{invite.attrib['id']}", "DELETE", params=params)
+    except StopIteration:
+        logger.error(f"Failed to uninvite user {user.email}: no pending invite")
+        return BatchResult(failed={user.email: "No pending invite"}, permanent={user.email})
+    except Exception as e:
+        logger.error(f"Failed to uninvite user {user.email}: {e}")
+        return _failed([user.email], e)
+    return BatchResult(succeeded=[user.email])
+
+
+async def fetch_avatar(url: str, size: int, headers: dict[str, str] | None = None) -> httpx.Response:
+    """Fetch an avatar downsized by the Plex server's photo transcoder.
+
+    The original is never downloaded, it can be any size, the avatar route sends the browser to it instead.
+    """
+    params = {"url": url, "width": size, "height": size, "minSize": 1, "upscale": 1}
+    return await _client().get(
+        _server_url("/photo/:/transcode"), params=params, headers={**_headers(), **(headers or {})}
+    )
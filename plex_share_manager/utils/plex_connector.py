@@ -1,4 +1,8 @@
 # Plex Connector and User Management utilities
+#
+# The app reaches Plex through plex_async, writes go through the outbox. The plexapi based fetches and
+# update_user_access here are only kept as the threaded baseline of scripts/benchmark_plex.py, the shared helpers
+# (BatchResult, plan_access, pending_changes, parse_shared_sections) are used by plex_async.
 
 # Local modules
 from ..models import User, Section
@@ -6,29 +10,175 @@ from ..utils import utils
 from rxconfig import config_state, logger
 
 # stdlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Callable
+from xml.etree import ElementTree
 
 # dependencies
 import reflex as rx
+import requests
 from sqlmodel import select
-from plexapi.myplex import PlexServer
+from plexapi.exceptions import NotFound
+from plexapi.myplex import MyPlexAccount, PlexServer
 
 # Constants
-allow_sync = 1 if config_state.app_settings["ALLOW_SYNC"] else 0
-_plex_server = None  # Cache connection
+CONNECTION_TTL = 3600  # Seconds before the cached server and account are rebuilt
+LIVENESS_INTERVAL = 60  # Seconds between server pings on reuse
+_plex_connection = None  # Cache connection
+_connection_lock = threading.Lock()
+# One keep-alive session for every plexapi request, sized for the worker pool
+_session = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, int(config_state.app_settings["PLEX_MAX_WORKERS"])))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+
+@dataclass
+class BatchResult:
+    """Per-user outcome of a Plex call fanned out over the worker pool."""
+
+    succeeded: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    # Failed emails Plex rejected, retrying sends the same request again
+    permanent: set[str] = field(default_factory=set)
+    skipped: int = 0
+
+
+@dataclass(frozen=True)
+class Access:
+    """Desired Plex access for one user, allow_sync is None when it is left untouched."""
+
+    titles: list[str]
+    keys: frozenset[int] | None
+    allow_sync: bool | None
+
+
+def plan_access(users: list[User], delete: bool = False) -> dict[str, Access]:
+    """Build each user's desired access, sections are resolved here so workers never lazy load."""
+    expired_title = config_state.app_settings["SECTION_EXPIRED"]
+    with rx.session() as session:
+        expired_key = session.exec(select(Section.key).where(Section.title == expired_title)).first()
+    expired = Access([expired_title], None if expired_key is None else frozenset([expired_key]), None)
+    allow_sync = bool(config_state.app_settings["ALLOW_SYNC"])
+    plans: dict[str, Access] = {}
+    for user in users:
+        if user.status == "expired" or delete is True:
+            plans[user.email] = expired
+        else:
+            sections = user.sections
+            plans[user.email] = Access(
+                [section.title for section in sections], frozenset(section.key for section in sections), allow_sync
+            )
+    return plans
+
+
+def pending_changes(
+    plans: dict[str, Access], shared_sections: dict[str, set[int]], allow_sync: dict[str, bool]
+) -> list[str]:
+    """Return the emails whose desired access differs from the last known Plex state."""
+    changed: list[str] = []
+    for email, access in plans.items():
+        current_keys = shared_sections.get(email.lower())
+        if (
+            access.keys is None
+            or current_keys is None
+            or access.keys != current_keys
+            or (access.allow_sync is not None and allow_sync.get(email.lower()) != access.allow_sync)
+        ):
+            changed.append(email)
+    return changed
+
+
+def _run_per_user(func: Callable[[str], None], emails: list[str]) -> BatchResult:
+    """Run func for each email on a bounded thread pool, one failure does not stop the others."""
+    result = BatchResult()
+    if not emails:
+        return result
+    max_workers = min(max(1, int(config_state.app_settings["PLEX_MAX_WORKERS"])), len(emails))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plex") as pool:
+        futures = {pool.submit(func, email): email for email in emails}
+        for future in as_completed(futures):
+            email = futures[future]
+            try:
+                future.result()
+                result.succeeded.append(email)
+            except Exception as e:
+                logger.error(f"Failed to update user {email}: {e}")
+                result.failed[email] = str(e)
+    return result
+
+
+class _PlexConnection:
+    """Server and account handles cached for one (base URL, token) pair."""
+
+    def __init__(self, baseurl: str, token: str) -> None:
+        self.key = (baseurl, token)
+        self.server = PlexServer(baseurl=baseurl, token=token, session=_session)
+        self.created_at = self.checked_at = time.monotonic()
+        self._account: MyPlexAccount | None = None
+
+    @property
+    def account(self) -> MyPlexAccount:
+        if self._account is None:
+            self._account = MyPlexAccount(token=self.key[1], session=_session)
+        return self._account
+
+    def is_alive(self) -> bool:
+        """Ping the server at most every LIVENESS_INTERVAL seconds."""
+        if time.monotonic() - self.checked_at < LIVENESS_INTERVAL:
+            return True
+        try:
+            self.server.query("/identity")
+        except Exception as e:
+            logger.warning(f"Plex server connection lost, reconnecting: {e}")
+            return False
+        self.checked_at = time.monotonic()
+        return True
+
+
+def _connection() -> _PlexConnection:
+    """Return the cached connection, rebuilding it on credential change, expiry or failure."""
+    global _plex_connection
+    key = (
+        config_state.app_settings["PLEXAPI_AUTH_SERVER_BASEURL"],
+        config_state.app_settings["PLEXAPI_AUTH_SERVER_TOKEN"],
+    )
+    with _connection_lock:
+        connection = _plex_connection
+        if (
+            connection is None
+            or connection.key != key
+            or time.monotonic() - connection.created_at > CONNECTION_TTL
+            or not connection.is_alive()
+        ):
+            try:
+                connection = _PlexConnection(*key)
+            except Exception as e:
+                logger.error(f"Failed to connect to Plex server: {e}")
+                raise e
+            _plex_connection = connection
+        return connection
+
+
+def _reset_connection(error: Exception) -> None:
+    """Drop the cached connection after a network error so the next call reconnects."""
+    global _plex_connection
+    if isinstance(error, requests.RequestException):
+        with _connection_lock:
+            _plex_connection = None
 
 
 def _connect_plex_server() -> PlexServer:
     """Connect to Plex server with caching."""
-    global _plex_server
-    try:
-        if _plex_server is None:
-            _plex_server = PlexServer(
-                baseurl=config_state.app_settings["PLEXAPI_AUTH_SERVER_BASEURL"],
-                token=config_state.app_settings["PLEXAPI_AUTH_SERVER_TOKEN"],
-            )
-    except Exception as e:
-        logger.error(f"Failed to connect to Plex server: {e}")
-    return _plex_server
+    return _connection().server
+
+
+def _plex_account() -> MyPlexAccount:
+    """Return the cached plex.tv account for the configured token."""
+    return _connection().account
 
 
 def get_plex_users() -> list[User]:
@@ -39,11 +189,14 @@ def get_plex_users() -> list[User]:
         local_sections = session.exec(select(Section)).all()
     try:
         plex_server = _connect_plex_server()
-        plex_users = plex_server.myPlexAccount().users()
+        account = _plex_account()
+        plex_users = account.users()
+        shared_sections = _fetch_shared_sections(plex_server, account)
         # Fetch pending invites broken at the moment
-        # pending_invites = plex_server.myPlexAccount().pendingInvites(includeReceived=False)
+        # pending_invites = account.pendingInvites(includeReceived=False)
 
     except Exception as e:
+        _reset_connection(e)
         logger.error(f"Failed to fetch Plex users: {e}")
         raise e
     try:
@@ -52,7 +205,7 @@ def get_plex_users() -> list[User]:
         for plex_user in plex_users:
             if plex_user.email is None:
                 continue
-            new_user_sections = get_users_sections(plex_user.email)
+            new_user_sections = shared_sections.get(plex_user.email.lower(), set())
             # Filter sections that user has access to
             new_user = User(
                 plex_id=plex_user.id,
@@ -84,18 +237,25 @@ def get_plex_users() -> list[User]:
     return users
 
 
-def get_users_sections(user_email: str) -> list[str]:
-    """Fetch library sections shared with Plex user."""
-    try:
-        user_sections: list[str] = []
-        plex_server = _connect_plex_server()
-        all_sections = plex_server.myPlexAccount().user(user_email).server(plex_server.friendlyName).sections()
-        for section in all_sections:
-            if section.shared:
-                user_sections.append(section.key)
-    except Exception as e:
-        logger.error(f"Failed to fetch user sections for {user_email}: {e}")
-    return user_sections
+def _fetch_shared_sections(plex_server: PlexServer, account: MyPlexAccount) -> dict[str, set[int]]:
+    """Read every friend's shared sections from the single shared_servers listing."""
+    data = account.query(account.FRIENDINVITE.format(machineId=plex_server.machineIdentifier))
+    return parse_shared_sections(data)
+
+
+def parse_shared_sections(data: ElementTree.Element) -> dict[str, set[int]]:
+    """Map lower-cased email to shared section keys from a shared_servers response."""
+    shared_sections: dict[str, set[int]] = {}
+    for shared_server in data.iter("SharedServer"):
+        email = shared_server.attrib.get("email")
+        if not email:
+            continue
+        shared_sections[email.lower()] = {
+            int(section.attrib["key"])
+            for section in shared_server.iter("Section")
+            if section.attrib.get("shared") == "1"
+        }
+    return shared_sections
 
 
 def get_plex_sections() -> list[Section]:
@@ -107,45 +267,36 @@ def get_plex_sections() -> list[Section]:
         for section in server_sections:
             sections.append(Section(key=section.key, title=section.title))
     except Exception as e:
+        _reset_connection(e)
         logger.error(f"Failed to fetch Plex sections: {e}")
     return sections
 
 
-def update_user_access(users: list[User], delete=False) -> None:
-    """Update user access to Plex library sections."""
+def update_user_access(users: list[User], delete=False) -> BatchResult:
+    """Update user access to Plex library sections, skipping users whose access already matches."""
+    plans = plan_access(users, delete)
     try:
         plex_server = _connect_plex_server()
-        account = plex_server.myPlexAccount()
-        for user in users:
-            sections = [section.title for section in user.sections]
-            user_email = account.user(user.email)
-            if user.status == "expired" or delete is True:
-                account.updateFriend(user_email, plex_server, sections=[config_state.app_settings["SECTION_EXPIRED"]])
-            else:
-                account.updateFriend(user_email, plex_server, sections=sections, allowSync=allow_sync)
+        account = _plex_account()
+        # One users() listing instead of account.user(), which re-fetches it for every lookup
+        friends = {friend.email.lower(): friend for friend in account.users() if friend.email}
+        shared_sections = _fetch_shared_sections(plex_server, account)
     except Exception as e:
-        logger.error(f"Failed to update user {user.email}: {e}")
-    return None
+        _reset_connection(e)
+        logger.error(f"Failed to fetch Plex friends: {e}")
+        return BatchResult(failed={email: str(e) for email in plans})
 
+    allow_sync = {email: bool(friend.allowSync) for email, friend in friends.items()}
+    changed = pending_changes(plans, shared_sections, allow_sync)
 
-def invite_new_user(user: User, sections: Section) -> None:
-    """Invite a new user to the Plex server."""
-    sections = [section.title for section in sections]
-    try:
-        plex_server = _connect_plex_server()
-        account = plex_server.myPlexAccount()
-        account.inviteFriend(user.email, plex_server, sections=sections, allowSync=allow_sync)
-    except Exception as e:
-        logger.error(f"Failed to invite user {user.email}: {e}")
-    return None
-
+    def update_friend(email: str) -> None:
+        friend = friends.get(email.lower())
+        if friend is None:
+            raise NotFound(f"{email} is not a Plex friend")
+        access = plans[email]
+        account.updateFriend(friend, plex_server, sections=access.titles, allowSync=access.allow_sync)
 
-def uninvite_user(user: User) -> None:
-    """Uninvite a user from the Plex server."""
-    try:
-        plex_server = _connect_plex_server()
-        account = plex_server.myPlexAccount()
-        account.cancelInvite(user.email)
-    except Exception as e:
-        logger.error(f"Failed to uninvite user {user.email}: {e}")
-    return None
+    result = _run_per_user(update_friend, changed)
+    result.skipped = len(plans) - len(changed)
+    logger.info(f"Updated {len(changed)} Plex users, skipped {result.skipped} unchanged")
+    return result
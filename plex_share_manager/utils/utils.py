@@ -5,21 +5,36 @@ from rxconfig import config_state
 
 # stdlib
 from datetime import date, timedelta
-
+from typing import Iterator
 
 # dependencies
 
+# Constants
+EXPIRING_DAYS = 30  # Users expiring within this many days are shown as "expiring"
+
 
-def user_status_and_expiry(expiry_date: date | str, never_expire: bool) -> tuple[date, str]:
+def user_status_and_expiry(expiry_date: date | str, never_expire: bool, today: date | None = None) -> tuple[date, str]:
     """Calculate the status of a user based on their expiry date."""
     status: str = "expired"
+    today = today or date.today()
     if expiry_date is None or expiry_date == "":
-        expiry_date = date.today() + timedelta(days=config_state.app_settings["DEFAULT_EXPIRY_DAYS"])
+        expiry_date = default_expiry_date(today)
     elif isinstance(expiry_date, str):
         expiry_date = date.fromisoformat(expiry_date)
-    delta = (expiry_date - date.today()).days
+    delta = (expiry_date - today).days
     if never_expire is True:
         status = "never"
     else:
-        status = "expired" if delta < 0 else "expiring" if delta <= 30 else "active"
+        status = "expired" if delta < 0 else "expiring" if delta <= EXPIRING_DAYS else "active"
     return expiry_date, status
+
+
+def default_expiry_date(today: date) -> date:
+    """Expiry date of a user added without one."""
+    return today + timedelta(days=config_state.app_settings["DEFAULT_EXPIRY_DAYS"])
+
+
+def chunked(items: list, size: int) -> Iterator[list]:
+    """Yield consecutive slices of items holding at most size elements."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
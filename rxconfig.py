@@ -14,9 +14,9 @@ import reflex as rx
 
 # Setup config file
 config_file = Path(__file__).parent / "data/config.toml"
+default_config_file = Path(__file__).parent / "plex_share_manager/default_config.toml"
 
 if not config_file.exists():
-    default_config_file = Path(__file__).parent / "plex_share_manager/default_config.toml"
     shutil.copy2(default_config_file, config_file)
 
 
@@ -26,8 +26,11 @@ class ConfigState:
 
     def load_settings_toml(self) -> None:
         """Load the settings from the environment variables."""
-        with open(self.config_file, "rb") as f:
+        # Defaults first so keys added in newer releases exist for older config files
+        with open(default_config_file, "rb") as f:
             settings = toml.load(f)
+        with open(self.config_file, "rb") as f:
+            settings.update(toml.load(f))
 
         if os.getenv("PLEXAPI_AUTH_SERVER_TOKEN"):
             settings["PLEXAPI_AUTH_SERVER_TOKEN"] = os.getenv("PLEXAPI_AUTH_SERVER_TOKEN")
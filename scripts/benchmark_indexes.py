@@ -0,0 +1,154 @@
+# Show SQLite query plans and timings for the dashboard and task queries without and with the indexes of the index
+# migration, and the section key lookup without and with its unique index.
+#
+# Usage: python scripts/benchmark_indexes.py --users 50000 --sections 12
+
+# Local modules
+
+# stdlib
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# dependencies
+
+# The before schema is head without these, so it always matches the models the queries select
+MEASURED_INDEXES = {
+    # ae687aee5106
+    "user": ["ix_user_expiry_date", "ix_user_name", "ix_user_plex_id", "ix_user_status", "ix_user_username"],
+    "usersectionlink": ["ix_usersectionlink_section_id_user_id"],
+    # 4b1e9c7d2a60
+    "section": ["ix_section_key"],
+}
+SORT_COLUMNS = ["plex_id", "name", "username", "email", "expiry_date"]
+PAGE_SIZE = 50
+
+
+def seed(users: int, sections: int) -> None:
+    import reflex as rx
+    from plex_share_manager.models import User, Section
+    from plex_share_manager.models.sections import UserSectionLink
+
+    rng = random.Random(0)
+    today = date.today()
+    with rx.session() as session:
+        session.bulk_insert_mappings(
+            Section, [{"key": key, "title": f"Library {key}"} for key in range(1, sections + 1)]
+        )
+        session.bulk_insert_mappings(
+            User,
+            [
+                {
+                    "plex_id": rng.randint(1, 10**8),
+                    "name": f"Name {rng.randint(1, users)}",
+                    "username": f"user{id}",
+                    "email": f"user{id}@example.com",
+                    "expiry_date": today + timedelta(days=rng.randint(-365, 365)),
+                    "never_expire": rng.random() < 0.05,
+                    "status": rng.choice(["active", "expiring", "expired", "never"]),
+                }
+                for id in range(1, users + 1)
+            ],
+        )
+        session.bulk_insert_mappings(
+            UserSectionLink,
+            [
+                {"user_id": user_id, "section_id": section_id}
+                for user_id in range(1, users + 1)
+                for section_id in rng.sample(range(1, sections + 1), k=rng.randint(1, sections))
+            ],
+        )
+        session.commit()
+
+
+def queries(sections: int) -> list[tuple[str, object]]:
+    """The statements behind the dashboard pages, section lookups and daily tasks."""
+    from sqlmodel import asc, select
+    from plex_share_manager.models import User, Section
+    from plex_share_manager.models.sections import UserSectionLink
+
+    today = date.today()
+    statements = []
+    for column in SORT_COLUMNS:
+        sort_column = getattr(User, column)
+        page = select(User).order_by(asc(sort_column), asc(User.id)).limit(PAGE_SIZE)
+        statements.append((f"dashboard sort by {column}", page))
+        statements.append((f"dashboard sort by {column}, page 100", page.offset(99 * PAGE_SIZE)))
+    statements += [
+        ("section by key", select(Section).where(Section.key == sections // 2)),
+        ("users in section", select(UserSectionLink.user_id).where(UserSectionLink.section_id == sections // 2)),
+        ("daily: expired users", select(User).where(User.status == "expired", User.never_expire.is_(False))),
+        ("daily: expiring in 7 days", select(User).where(User.expiry_date.between(today, today + timedelta(days=7)))),
+    ]
+    return statements
+
+
+def report(title: str, runs: int, sections: int) -> dict[str, float]:
+    import reflex as rx
+
+    print(f"\n## {title}")
+    timings: dict[str, float] = {}
+    with rx.session() as session:
+        connection = session.connection()
+        for label, statement in queries(sections):
+            sql = str(statement.compile(connection, compile_kwargs={"literal_binds": True}))
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                connection.exec_driver_sql(sql).fetchall()
+                samples.append((time.perf_counter() - start) * 1000)
+            timings[label] = statistics.median(samples)
+            print(f"{label:<40} {timings[label]:8.2f}ms")
+            for row in plan:
+                print(f"{'':<4}{row[-1]}")
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare query plans before and after the index migration")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    database = Path(tempfile.mkdtemp()) / "benchmark.db"
+    os.environ["DB_URL"] = f"sqlite:///{database}"
+
+    import rxconfig  # noqa: F401
+    import plex_share_manager.plex_share_manager  # noqa: F401
+    from reflex.model import Model, get_engine
+
+    with get_engine().connect() as connection:
+        Model._alembic_upgrade(connection)
+        for names in MEASURED_INDEXES.values():
+            for name in names:
+                connection.exec_driver_sql(f"DROP INDEX {name}")
+        connection.commit()
+    seed(args.users, args.sections)
+    print(f"{args.users} users, {args.sections} sections, median of {args.runs} runs")
+    before = report("before (head without the measured indexes)", args.runs, args.sections)
+    with get_engine().connect() as connection:
+        for table, names in MEASURED_INDEXES.items():
+            for index in Model.metadata.tables[table].indexes:
+                if index.name in names:
+                    index.create(connection)
+        connection.commit()
+    after = report("after (head)", args.runs, args.sections)
+
+    print("\n## speedup")
+    for label in before:
+        print(
+            f"{label:<40} {before[label]:8.2f}ms -> {after[label]:8.2f}ms  x{before[label] / max(after[label], 1e-3):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Time the Plex import and expiry sweep against the local fake server.
+#
+# Usage: python scripts/benchmark_plex.py --friends 10000 --latency-ms 20
+
+# Local modules
+
+# stdlib
+import argparse
+import asyncio
+from datetime import date, timedelta
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# dependencies
+
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    print(f"{label:<40} {time.perf_counter() - start:8.2f}s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark plex_connector and plex_async against a fake Plex")
+    parser.add_argument("--friends", type=int, default=1000)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from fake_plex_server import serve, patch_plex_tv
+
+    server, plex = serve(0, args.friends, args.sections, args.latency_ms, args.error_rate)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    database = Path(tempfile.mkdtemp()) / "benchmark.db"
+    os.environ.update(
+        DB_URL=f"sqlite:///{database}",
+        PLEXAPI_AUTH_SERVER_BASEURL=url,
+        PLEXAPI_AUTH_SERVER_TOKEN="fake-token",
+    )
+
+    import reflex as rx
+    import sqlmodel
+    from rxconfig import config_state
+    from plex_share_manager.models import User
+    from plex_share_manager.utils import plex_async, plex_connector
+    from plex_share_manager.tasks.daily import disable_expired_users
+
+    if args.workers:
+        config_state.app_settings["PLEX_MAX_WORKERS"] = args.workers
+    patch_plex_tv(url)
+    sqlmodel.SQLModel.metadata.create_all(rx.model.get_engine())
+    with rx.session() as session:
+        for section in plex_connector.get_plex_sections():
+            session.add(section)
+        session.commit()
+
+    print(f"{args.friends} friends, {args.sections} sections, {args.latency_ms}ms latency, {url}")
+    users = timed("import: plex_connector.get_plex_users", plex_connector.get_plex_users)
+    timed("import: plex_async.get_plex_users", plex_async.get_plex_users)
+
+    expired = [User(email=user.email, status="expired") for user in users]
+    for label, update in (("threaded", plex_connector.update_user_access), ("async", plex_async.update_user_access)):
+        writes = plex.writes
+        result = timed(f"expiry sweep: {label}", update, expired)
+        print(
+            f"{'':<40} {plex.writes - writes} writes, {len(result.succeeded)} updated, "
+            f"{result.skipped} skipped, {len(result.failed)} failed"
+        )
+
+    # The daily task only sends users who expired since their access was last applied
+    today = date.today()
+    with rx.session() as session:
+        session.add_all(
+            User(email=user.email, plex_id=user.plex_id, status="expired", expiry_date=today - timedelta(days=1))
+            for user in users
+        )
+        session.commit()
+    newly_expired = users[: max(1, len(users) // 20)]
+    for label in ("first run", "next day", f"{len(newly_expired)} newly expired"):
+        if label.endswith("newly expired"):
+            # Renewed two days ago with access back in Plex, expired again yesterday
+            with rx.session() as session:
+                for user in session.exec(sqlmodel.select(User).limit(len(newly_expired))):
+                    user.access_applied_on = today - timedelta(days=2)
+                    plex.set_sections(user.plex_id, [next(iter(plex.section_keys_by_id))])
+                    session.add(user)
+                session.commit()
+        writes, requests = plex.writes, plex.requests
+        result = timed(f"daily task: {label}", disable_expired_users)
+        print(f"{'':<40} {result.changed} applied, {plex.requests - requests} requests, {plex.writes - writes} writes")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Local stand-in for a Plex server and the plex.tv endpoints used by plex_connector and plex_async.
+#
+# Usage: python scripts/fake_plex_server.py --friends 10000 --sections 12 --latency-ms 20 --error-rate 0.01
+# Point PLEXAPI_AUTH_SERVER_BASEURL at it and redirect plex.tv with patch_plex_tv() (see benchmark_plex.py).
+
+# Local modules
+
+# stdlib
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import quoteattr
+
+# dependencies
+
+
+MACHINE_ID = "fake-plex-machine"
+EXPIRED_TITLE = "Expired"
+
+
+class FakePlex:
+    """In-memory friends, sections, shares and invites."""
+
+    def __init__(self, friends: int, sections: int, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # key -> (plex.tv section id, title)
+        self.sections = {key: (1000 + key, f"Library {key}") for key in range(1, sections + 1)}
+        self.sections[sections + 1] = (1000 + sections + 1, EXPIRED_TITLE)
+        self.section_keys_by_id = {section_id: key for key, (section_id, _) in self.sections.items()}
+        self.friends: dict[int, dict] = {}
+        for user_id in range(1, friends + 1):
+            shared = set(rng.sample(sorted(self.sections), k=rng.randint(1, len(self.sections))))
+            self.friends[user_id] = {
+                "id": user_id,
+                "email": f"friend{user_id}@example.com",
+                "username": f"friend{user_id}",
+                "thumb": f"https://plex.tv/users/{user_id:032x}/avatar",
+                "allowSync": rng.random() < 0.5,
+                "share_id": 50000 + user_id,
+                "sections": shared,
+            }
+        self.invites: dict[int, str] = {}
+        self.writes = 0
+        self.requests = 0
+
+    # XML renderers
+    def identity(self) -> str:
+        return f'<MediaContainer size="0" machineIdentifier="{MACHINE_ID}" version="1.41.0"/>'
+
+    def server_root(self) -> str:
+        return (
+            f'<MediaContainer size="0" friendlyName="Fake Plex" machineIdentifier="{MACHINE_ID}" '
+            'myPlex="1" version="1.41.0" platform="Linux"/>'
+        )
+
+    def library_sections(self) -> str:
+        directories = "".join(
+            f'<Directory key="{key}" type="movie" title={quoteattr(title)} agent="tv.plex.agents.movie" '
+            f'uuid="section-{key}"/>'
+            for key, (_, title) in self.sections.items()
+        )
+        return f'<MediaContainer size="{len(self.sections)}" title1="Plex Library">{directories}</MediaContainer>'
+
+    def account(self) -> str:
+        return (
+            '<user id="1" uuid="fake-owner" username="owner" title="owner" email="owner@example.com" '
+            'authToken="fake-token" scrobbleTypes="" thumb="">'
+            '<subscription active="1" status="Active" plan="lifetime"><features/></subscription>'
+            '<profile autoSelectAudio="1" autoSelectSubtitle="0"/></user>'
+        )
+
+    def users(self) -> str:
+        with self.lock:
+            users = "".join(
+                f'<User id="{friend["id"]}" title="{friend["username"]}" username="{friend["username"]}" '
+                f'email="{friend["email"]}" thumb="{friend["thumb"]}" allowSync="{int(friend["allowSync"])}" '
+                f'home="0" restricted="0" protected="0">'
+                f'<Server id="{friend["share_id"]}" serverId="1" machineIdentifier="{MACHINE_ID}" name="Fake Plex" '
+                f'numLibraries="{len(friend["sections"])}" allLibraries="0" owned="0" pending="0"/></User>'
+                for friend in self.friends.values()
+            )
+        return f'<MediaContainer friendlyName="myPlex" size="{len(self.friends)}">{users}</MediaContainer>'
+
+    def plex_tv_server(self) -> str:
+        sections = "".join(
+            f'<Section id="{section_id}" key="{key}" type="movie" title={quoteattr(title)}/>'
+            for key, (section_id, title) in self.sections.items()
+        )
+        return f'<MediaContainer size="1"><Server machineIdentifier="{MACHINE_ID}">{sections}</Server></MediaContainer>'
+
+    def _shared_server(self, friend: dict) -> str:
+        sections = "".join(
+            f'<Section id="{section_id}" key="{key}" title={quoteattr(title)} type="movie" '
+            f'shared="{int(key in friend["sections"])}"/>'
+            for key, (section_id, title) in self.sections.items()
+        )
+        return (
+            f'<SharedServer id="{friend["share_id"]}" userID="{friend["id"]}" email="{friend["email"]}" '
+            f'username="{friend["username"]}" accessToken="token-{friend["id"]}">{sections}</SharedServer>'
+        )
+
+    def shared_servers(self) -> str:
+        with self.lock:
+            shares = "".join(self._shared_server(friend) for friend in self.friends.values())
+        return f'<MediaContainer size="{len(self.friends)}">{shares}</MediaContainer>'
+
+    def shared_server(self, share_id: int) -> str | None:
+        friend = self.friends.get(share_id - 50000)
+        return None if friend is None else f"<MediaContainer>{self._shared_server(friend)}</MediaContainer>"
+
+    def requested_invites(self) -> str:
+        with self.lock:
+            invites = "".join(
+                f'<Invite id="{invite_id}" email="{email}" username="" friend="1" home="0" server="1"/>'
+                for invite_id, email in self.invites.items()
+            )
+        return f'<MediaContainer size="{len(self.invites)}">{invites}</MediaContainer>'
+
+    # Mutations
+    def set_sections(self, user_id: int, section_ids: list[int]) -> bool:
+        with self.lock:
+            friend = self.friends.get(user_id)
+            if friend is None:
+                return False
+            friend["sections"] = {self.section_keys_by_id[section_id] for section_id in section_ids}
+            self.writes += 1
+            return True
+
+    def set_allow_sync(self, user_id: int, allow_sync: bool) -> bool:
+        with self.lock:
+            friend = self.friends.get(user_id)
+            if friend is None:
+                return False
+            friend["allowSync"] = allow_sync
+            self.writes += 1
+            return True
+
+    def invite(self, email: str) -> None:
+        with self.lock:
+            self.invites[len(self.invites) + 1] = email
+            self.writes += 1
+
+    def cancel_invite(self, invite_id: int) -> bool:
+        with self.lock:
+            self.writes += 1
+            return self.invites.pop(invite_id, None) is not None
+
+
+def make_handler(plex: FakePlex, latency: float, error_rate: float) -> type[BaseHTTPRequestHandler]:
+    shared_server_path = re.compile(rf"^/api/servers/{MACHINE_ID}/shared_servers/(\d+)$")
+    sharing_path = re.compile(r"^/api/v2/sharings/(\d+)$")
+    invite_path = re.compile(r"^/api/invites/requested/(\d+)$")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def _send(self, status: int, body: str = "") -> None:
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/xml;charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _json(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _route(self, method: str) -> None:
+            with plex.lock:
+                plex.requests += 1
+            if latency:
+                time.sleep(latency)
+            if error_rate and random.random() < error_rate:
+                return self._send(503, "<Response code='503' status='Injected error'/>")
+            url = urlsplit(self.path)
+            path, query = url.path.rstrip("/") or "/", parse_qs(url.query)
+            if method == "GET":
+                body = {
+                    "/": plex.server_root,
+                    "/identity": plex.identity,
+                    "/library": lambda: '<MediaContainer size="0" title1="Plex Library"/>',
+                    "/library/sections": plex.library_sections,
+                    "/api/v2/user": plex.account,
+                    "/api/users": plex.users,
+                    f"/api/servers/{MACHINE_ID}": plex.plex_tv_server,
+                    f"/api/servers/{MACHINE_ID}/shared_servers": plex.shared_servers,
+                    "/api/invites/requested": plex.requested_invites,
+                    "/api/invites/requests": lambda: '<MediaContainer size="0"/>',
+                }.get(path)
+                if body is not None:
+                    return self._send(200, body())
+                if match := shared_server_path.match(path):
+                    body = plex.shared_server(int(match.group(1)))
+                    return self._send(200, body) if body else self._send(404)
+            elif method == "PUT" and (match := shared_server_path.match(path)):
+                shared = self._json()["shared_server"]
+                ok = plex.set_sections(int(match.group(1)) - 50000, shared["library_section_ids"])
+                return self._send(200 if ok else 404)
+            elif method == "PUT" and (match := sharing_path.match(path)):
+                allow_sync = query.get("allowSync", ["0"])[0] == "1"
+                return self._send(200 if plex.set_allow_sync(int(match.group(1)), allow_sync) else 404)
+            elif method == "POST" and path == f"/api/servers/{MACHINE_ID}/shared_servers":
+                shared = self._json()["shared_server"]
+                if "invited_id" in shared:
+                    ok = plex.set_sections(int(shared["invited_id"]), shared["library_section_ids"])
+                    return self._send(200 if ok else 404)
+                plex.invite(shared["invited_email"])
+                return self._send(201)
+            elif method == "DELETE" and (match := invite_path.match(path)):
+                return self._send(200 if plex.cancel_invite(int(match.group(1))) else 404)
+            self._send(404)
+
+        def do_GET(self) -> None:
+            self._route("GET")
+
+        def do_PUT(self) -> None:
+            self._route("PUT")
+
+        def do_POST(self) -> None:
+            self._route("POST")
+
+        def do_DELETE(self) -> None:
+            self._route("DELETE")
+
+    return Handler
+
+
+def serve(
+    port: int = 0, friends: int = 100, sections: int = 8, latency_ms: float = 0, error_rate: float = 0, seed: int = 0
+) -> tuple[ThreadingHTTPServer, FakePlex]:
+    """Start the fake server on a daemon thread and return it with its state."""
+    plex = FakePlex(friends, sections, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(plex, latency_ms / 1000, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, plex
+
+
+def patch_plex_tv(url: str) -> None:
+    """Send every plex.tv request from plexapi and plex_async to url instead."""
+    from plexapi import myplex
+    from plex_share_manager.utils import plex_async
+
+    plex_async.PLEX_TV_URL = url
+    for cls in (myplex.MyPlexAccount, myplex.MyPlexUser, myplex.MyPlexInvite):
+        for name, value in list(vars(cls).items()):
+            if isinstance(value, str) and value.startswith("https://plex.tv"):
+                setattr(cls, name, value.replace("https://plex.tv", url, 1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Plex server and plex.tv API for offline benchmarks")
+    parser.add_argument("--port", type=int, default=32400)
+    parser.add_argument("--friends", type=int, default=100)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server, _ = serve(args.port, args.friends, args.sections, args.latency_ms, args.error_rate, args.seed)
+    print(f"Fake Plex listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,123 @@
+# Measure how late the event loop runs a 10ms heartbeat while a user import runs, with the import's database
+# work run inline on the loop and offloaded to the thread pool.
+#
+# Exits with status 1 when the offloaded import delays the heartbeat by more than --max-lag-ms.
+#
+# Usage: python scripts/measure_loop_lag.py --friends 20000 --existing 20000 --max-lag-ms 500
+
+# Local modules
+
+# stdlib
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# dependencies
+
+# Constants
+TICK = 0.01  # s, heartbeat interval, lag is how much later than this a tick wakes up
+MAX_LAG_MS = 500  # ms, default --max-lag-ms, the inline import stalls the loop for about 2s at 5000 friends
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def run_import(offloaded: bool) -> tuple[float, list[float]]:
+    """One import like ImportState.import_plex_users then do_user_sync, returns (seconds, heartbeat lags in ms)."""
+    from plex_share_manager.state import importstate
+    from plex_share_manager.utils import offload, plex_async
+
+    async def call(func, *args):
+        return await offload.run_sync(func, *args) if offloaded else func(*args)
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(heartbeat(lags, stop))
+    start = time.perf_counter()
+    users = []
+    async for page in plex_async.iter_plex_users():
+        new_users, updated_users = await call(importstate.diff_users, page)
+        users += new_users + updated_users
+    await call(importstate.save_users, users)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    await plex_async.close()
+    return elapsed, lags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure event loop lag during a user import")
+    parser.add_argument("--friends", type=int, default=5000)
+    parser.add_argument("--existing", type=int, default=5000, help="users already in the database")
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--max-lag-ms", type=float, default=MAX_LAG_MS, help="fail when the offloaded import's max lag exceeds this"
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from fake_plex_server import serve, patch_plex_tv
+
+    server, _ = serve(0, args.friends, args.sections, args.latency_ms)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    database = Path(tempfile.mkdtemp()) / "loop_lag.db"
+    os.environ.update(
+        DB_URL=f"sqlite:///{database}",
+        PLEXAPI_AUTH_SERVER_BASEURL=url,
+        PLEXAPI_AUTH_SERVER_TOKEN="fake-token",
+    )
+
+    import reflex as rx
+    import sqlmodel
+    from plex_share_manager.models import User
+    from plex_share_manager.utils import offload, plex_async, plex_connector
+
+    patch_plex_tv(url)
+    sqlmodel.SQLModel.metadata.create_all(rx.model.get_engine())
+    with rx.session() as session:
+        for section in plex_connector.get_plex_sections():
+            session.add(section)
+        session.commit()
+    existing = asyncio.run(plex_async.get_plex_users())[: args.existing]
+
+    print(f"{args.friends} friends, {len(existing)} already imported, {args.latency_ms}ms latency")
+    print(f"{'':<12} {'import':>8} {'ticks':>6} {'p50 lag':>9} {'p99 lag':>9} {'max lag':>9}")
+    max_lags: dict[str, float] = {}
+    for label, offloaded in (("inline", False), ("offloaded", True)):
+        # Same starting point for both runs, every friend is new or changed
+        with rx.session() as session:
+            session.exec(sqlmodel.delete(User))
+            session.add_all(User(email=user.email, username="renamed") for user in existing)
+            session.commit()
+        elapsed, lags = asyncio.run(run_import(offloaded))
+        max_lags[label] = max(lags, default=0)
+        p99 = statistics.quantiles(lags, n=100, method="inclusive")[98] if len(lags) > 1 else max(lags, default=0)
+        print(
+            f"{label:<12} {elapsed:7.2f}s {len(lags):>6} {statistics.median(lags or [0]):7.1f}ms "
+            f"{p99:7.1f}ms {max_lags[label]:7.1f}ms"
+        )
+    for name, entry in offload.stats.items():
+        print(
+            f"{name:<40} {entry.calls:>5} calls, {entry.run_ms:8.1f}ms run, {entry.wait_ms:6.1f}ms queued, "
+            f"max {entry.max_run_ms:.1f}ms"
+        )
+    server.shutdown()
+
+    passed = max_lags["offloaded"] <= args.max_lag_ms
+    print(f"{'PASS' if passed else 'FAIL'}: offloaded max lag {max_lags['offloaded']:.1f}ms, limit {args.max_lag_ms}ms")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
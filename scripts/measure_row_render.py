@@ -0,0 +1,62 @@
+# Count the React components a dashboard table row renders and estimate the initial render size for large pages.
+# The virtual table only mounts the rows in view plus the overscan, --mounted-rows sets how many that is.
+#
+# Usage: python scripts/measure_row_render.py --rows 1000 10000
+
+# Local modules
+
+# stdlib
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# dependencies
+
+
+def count_components(component) -> int:
+    """Components in a tree, both branches of rx.cond and every rx.match case included."""
+    from reflex.components.component import Component
+
+    if not isinstance(component, Component):
+        return 0
+    children = list(component.children)
+    for attr in ("comp1", "comp2", "default"):
+        child = getattr(component, attr, None)
+        if isinstance(child, Component):
+            children.append(child)
+    for case in getattr(component, "match_cases", None) or []:
+        children.extend(child for child in case if isinstance(child, Component))
+    return 1 + sum(count_components(child) for child in children)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Count the components rendered per dashboard table row")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument(
+        "--mounted-rows", type=int, default=40, help="Rows the virtual table mounts, the viewport plus the overscan"
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import rxconfig  # noqa: F401
+    from plex_share_manager.pages.dashboard import dashboard, create_table_cells
+    from plex_share_manager.state import UserState
+
+    start = time.perf_counter()
+    page = dashboard()
+    page.render()
+    build_ms = (time.perf_counter() - start) * 1000
+    per_row = count_components(create_table_cells(UserState.all_users[0]))
+    # The row template is counted once in the page total
+    page_components = count_components(page) - per_row
+
+    print(f"components per row {per_row:>10}")
+    print(f"page without rows  {page_components:>10}   built and rendered in {build_ms:.0f} ms")
+    for rows in args.rows:
+        mounted = page_components + min(rows, args.mounted_rows) * per_row
+        print(f"{rows:>6} rows        {page_components + rows * per_row:>10} components, {mounted} mounted")
+
+
+if __name__ == "__main__":
+    main()
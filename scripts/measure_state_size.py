@@ -0,0 +1,86 @@
+# Measure the pickled size and serialization time of UserState holding User models versus UserRow projections.
+#
+# Usage: python scripts/measure_state_size.py --users 10000 --page-size 50
+
+# Local modules
+
+# stdlib
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# dependencies
+
+
+def seed(users: int) -> None:
+    import reflex as rx
+    import sqlmodel
+    from plex_share_manager.models import User
+
+    sqlmodel.SQLModel.metadata.create_all(rx.model.get_engine())
+    today = date.today()
+    with rx.session() as session:
+        session.bulk_insert_mappings(
+            User,
+            [
+                {
+                    "plex_id": id,
+                    "name": f"Name {id}",
+                    "username": f"user{id}",
+                    "email": f"user{id}@example.com",
+                    "avatar_url": f"https://plex.tv/users/{id:032x}/avatar?c=1700000000",
+                    "expiry_date": today + timedelta(days=id % 365),
+                    "status": "active",
+                }
+                for id in range(1, users + 1)
+            ],
+        )
+        session.commit()
+
+
+def measure(label: str, state, runs: int) -> None:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        payload = state._serialize()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<45} {len(payload) / 1024:10.1f} KiB {statistics.median(samples):9.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the serialized UserState size for User and UserRow rows")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    database = Path(tempfile.mkdtemp()) / "measure.db"
+    os.environ["DB_URL"] = f"sqlite:///{database}"
+
+    import reflex as rx
+    import rxconfig  # noqa: F401
+    from sqlmodel import select
+    from plex_share_manager.models import User
+    from plex_share_manager.state import UserState
+    from plex_share_manager.state.userstate import load_users_page
+
+    seed(args.users)
+    state = UserState(_reflex_internal_init=True)
+    print(f"{args.users} users, median of {args.runs} runs")
+    with rx.session() as session:
+        for rows in (args.page_size, args.users):
+            # What set_all_users held before: full table models, every row before pagination
+            state.all_users = session.exec(select(User).order_by(User.id).limit(rows)).all()
+            measure(f"{rows} User models", state, args.runs)
+            state.all_users, _, _ = load_users_page("", "", False, 1, rows)
+            measure(f"{rows} UserRow projections", state, args.runs)
+
+
+if __name__ == "__main__":
+    main()